@@ -0,0 +1,11 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+{
+    "name": "Mail Follower Copy",
+    "summary": "Copy the followers of a record to other records in bulk",
+    "version": "13.0.1.0.0",
+    "category": "Discuss",
+    "license": "AGPL-3",
+    "depends": ["mail"],
+    "data": [],
+    "installable": True,
+}
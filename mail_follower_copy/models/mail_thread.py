@@ -0,0 +1,35 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import models
+
+
+class MailThread(models.AbstractModel):
+    _inherit = "mail.thread"
+
+    def _message_copy_followers(self, targets):
+        """ Subscribe the partners following this record, with their
+        subtypes, to 'targets' with set-based inserts in mail.followers,
+        instead of one message_subscribe call per follower. Meant to be used
+        by copy() overrides, which only copied the partner followers, so the
+        channel followers aren't copied either. The context of self is kept,
+        so keys like 'apply_mode' reach the follower creation.
+        """
+        self.ensure_one()
+        if not targets:
+            return
+        targets.check_access_rights("write")
+        targets.check_access_rule("write")
+        partner_subtypes = {
+            follower.partner_id.id: follower.subtype_ids.ids
+            for follower in self.message_follower_ids.filtered("partner_id")
+        }
+        self.env["mail.followers"]._insert_followers(
+            targets._name,
+            targets.ids,
+            list(partner_subtypes),
+            partner_subtypes,
+            [],
+            {},
+            check_existing=True,
+            existing_policy="replace",
+        )
@@ -0,0 +1,72 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo.tests import SavepointCase
+
+
+class TestMailFollowerCopy(SavepointCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        partner_obj = cls.env["res.partner"]
+        cls.source = partner_obj.create({"name": "Source"})
+        cls.followers = partner_obj.create(
+            [{"name": "Follower %d" % i} for i in range(15)]
+        )
+        cls.subtype = cls.env.ref("mail.mt_note")
+        cls.source.message_subscribe(cls.followers.ids, subtype_ids=cls.subtype.ids)
+        cls.targets = partner_obj.create(
+            [{"name": "Target %d" % i} for i in range(200)]
+        )
+
+    def test_copy_followers(self):
+        self.source._message_copy_followers(self.targets)
+        for target in self.targets:
+            self.assertEqual(
+                target.message_partner_ids, self.source.message_partner_ids
+            )
+        follower = self.targets[0].message_follower_ids.filtered(
+            lambda f: f.partner_id == self.followers[0]
+        )
+        self.assertEqual(follower.subtype_ids, self.subtype)
+        # Copying again doesn't duplicate the followers
+        self.source._message_copy_followers(self.targets[:1])
+        self.assertEqual(
+            len(self.targets[0].message_follower_ids),
+            len(self.source.message_follower_ids),
+        )
+
+    def test_copy_channel_followers(self):
+        channel = self.env["mail.channel"].create({"name": "Follower channel"})
+        self.source.message_subscribe(channel_ids=channel.ids)
+        self.source._message_copy_followers(self.targets[:1])
+        self.assertEqual(
+            self.targets[0].message_partner_ids, self.source.message_partner_ids
+        )
+        self.assertFalse(self.targets[0].message_channel_ids)
+
+    def _count_queries(self, method, *args, **kwargs):
+        self.env["base"].flush()
+        query_count = self.env.cr.sql_log_count
+        method(*args, **kwargs)
+        self.env["base"].flush()
+        return self.env.cr.sql_log_count - query_count
+
+    def _subscribe_loop(self, targets):
+        # Same work as the former copy() overrides, i.e. one
+        # message_subscribe per follower and copied record
+        for target in targets:
+            for follower in self.source.message_follower_ids:
+                target.message_subscribe(
+                    partner_ids=follower.partner_id.ids,
+                    subtype_ids=follower.subtype_ids.ids,
+                )
+
+    def test_copy_followers_query_count(self):
+        loop_count = self._count_queries(self._subscribe_loop, self.targets[:20])
+        bulk_count = self._count_queries(
+            self.source._message_copy_followers, self.targets[20:40]
+        )
+        self.assertLess(bulk_count, loop_count)
+        self.assertEqual(
+            self.targets[0].message_partner_ids, self.targets[39].message_partner_ids
+        )
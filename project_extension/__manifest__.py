@@ -10,7 +10,7 @@
 Project Extension   """,
     'website': 'http://www.confianzit.com',
 
-    "depends": ['base', 'project'],
+    "depends": ['base', 'project', 'mail_follower_copy'],
 
     'data': [
         'views/project_stage_view.xml',
@@ -50,9 +50,7 @@ class Project(models.Model):
     @api.returns('self', lambda value: value.id)
     def copy(self, default=None):
         project = super(Project, self).copy(default)
-        for follower in self.message_follower_ids:
-            project.with_context(apply_mode="direct").message_subscribe(partner_ids=follower.partner_id.ids,
-                                                                        subtype_ids=follower.subtype_ids.ids)
+        self.with_context(apply_mode="direct")._message_copy_followers(project)
         return project
 
 
@@ -62,7 +60,5 @@ class Task(models.Model):
     @api.returns('self', lambda value: value.id)
     def copy(self, default=None):
         task = super(Task, self).copy(default)
-        for follower in self.message_follower_ids:
-            task.with_context(apply_mode="direct").message_subscribe(partner_ids=follower.partner_id.ids,
-                                                                     subtype_ids=follower.subtype_ids.ids)
+        self.with_context(apply_mode="direct")._message_copy_followers(task)
         return task
@@ -0,0 +1,50 @@
+from odoo.tests import SavepointCase
+
+
+class TestProjectCopy(SavepointCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestProjectCopy, cls).setUpClass()
+        cls.partners = cls.env['res.partner'].create(
+            [{'name': 'Follower %d' % i} for i in range(30)])
+
+    def _create_project(self, followers, task_count=10):
+        project = self.env['project.project'].create({'name': 'Project'})
+        tasks = self.env['project.task'].create([
+            {'name': 'Task %d' % i, 'project_id': project.id} for i in range(task_count)])
+        for record in project | tasks:
+            record.message_subscribe(followers.ids)
+        return project
+
+    def _copy_project(self, project):
+        project.flush()
+        project.invalidate_cache()
+        query_count = self.env.cr.sql_log_count
+        new_project = project.copy()
+        new_project.flush()
+        return new_project, self.env.cr.sql_log_count - query_count
+
+    def test_copy_followers(self):
+        project = self._create_project(self.partners[:15])
+        new_project, __ = self._copy_project(project)
+        self.assertEqual(new_project.message_partner_ids, project.message_partner_ids)
+        self.assertEqual(len(new_project.tasks), len(project.tasks))
+        for new_task in new_project.tasks:
+            task = project.tasks.filtered(lambda t: t.name == new_task.name)
+            self.assertEqual(new_task.message_partner_ids, task.message_partner_ids)
+            for follower in task.message_follower_ids:
+                new_follower = new_task.message_follower_ids.filtered(
+                    lambda f: f.partner_id == follower.partner_id)
+                self.assertEqual(new_follower.subtype_ids, follower.subtype_ids)
+
+    def test_copy_followers_query_count(self):
+        project_small = self._create_project(self.partners[:15])
+        project_large = self._create_project(self.partners)
+        __, small_count = self._copy_project(project_small)
+        __, large_count = self._copy_project(project_large)
+        # The followers are copied in bulk, so each extra follower costs
+        # its row insertion, instead of a message_subscribe call per
+        # follower and copied record
+        copied_followers = 15 * (len(project_large.tasks) + 1)
+        self.assertLess(large_count - small_count, 3 * copied_followers)
@@ -3,14 +3,14 @@
 {
     "name": "Return Merchandise Authorization Management",
     "summary": "Return Merchandise Authorization (RMA)",
-    "version": "13.0.1.2.1",
+    "version": "13.0.2.0.0",
     "development_status": "Production/Stable",
     "category": "RMA",
     "website": "https://github.com/OCA/rma",
     "author": "Tecnativa, Odoo Community Association (OCA)",
     "maintainers": ["ernestotejeda"],
     "license": "AGPL-3",
-    "depends": ["account", "stock"],
+    "depends": ["account", "fetchmail", "stock", "mail_follower_copy"],
     "data": [
         "views/report_rma.xml",
         "report/report.xml",
@@ -1,7 +1,12 @@
 # Copyright 2020 Tecnativa - Ernesto Tejeda
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from odoo import _, exceptions, http
+import base64
+import io
+
+from werkzeug.urls import url_encode
+
+from odoo import _, exceptions, fields, http
 from odoo.exceptions import AccessError, MissingError
 from odoo.http import request
 from odoo.tools import consteq
@@ -30,15 +35,48 @@ class PortalRma(CustomerPortal):
     def _get_filter_domain(self, kw):
         return []
 
+    def _get_keyset_domain(self, cursor, forward=True):
+        """ Domain of the RMAs placed after (or before, when not 'forward')
+        the cursor in the 'date desc, id desc' order. The cursor is the
+        '<date>,<id>' string of the boundary RMA.
+        """
+        try:
+            date, rma_id = cursor.rsplit(",", 1)
+            date, rma_id = fields.Datetime.to_datetime(date), int(rma_id)
+        except ValueError:
+            return []
+        if not date:
+            return []
+        operator = "<" if forward else ">"
+        return [
+            "|",
+            ("date", operator, date),
+            "&",
+            ("date", "=", date),
+            ("id", operator, rma_id),
+        ]
+
+    def _get_keyset_cursor(self, rma):
+        return "%s,%d" % (fields.Datetime.to_string(rma.date), rma.id)
+
     @http.route(
         ["/my/rmas", "/my/rmas/page/<int:page>"], type="http", auth="user", website=True
     )
-    def portal_my_rmas(self, page=1, date_begin=None, date_end=None, sortby=None, **kw):
+    def portal_my_rmas(
+        self,
+        page=1,
+        date_begin=None,
+        date_end=None,
+        sortby=None,
+        after=None,
+        before=None,
+        **kw
+    ):
         values = self._prepare_portal_layout_values()
         rma_obj = request.env["rma"]
         domain = self._get_filter_domain(kw)
         searchbar_sortings = {
-            "date": {"label": _("Date"), "order": "date desc"},
+            "date": {"label": _("Date"), "order": "date desc, id desc"},
             "name": {"label": _("Name"), "order": "name desc"},
             "state": {"label": _("Status"), "order": "state"},
         }
@@ -46,30 +84,60 @@ class PortalRma(CustomerPortal):
         if not sortby:
             sortby = "date"
         order = searchbar_sortings[sortby]["order"]
-        archive_groups = self._get_archive_groups("rma", domain)
         if date_begin and date_end:
             domain += [
                 ("create_date", ">", date_begin),
                 ("create_date", "<=", date_end),
             ]
-        # count for pager
-        rma_count = rma_obj.search_count(domain)
-        # pager
-        pager = portal_pager(
-            url="/my/rmas",
-            url_args={
-                "date_begin": date_begin,
-                "date_end": date_end,
-                "sortby": sortby,
-            },
-            total=rma_count,
-            page=page,
-            step=self._items_per_page,
-        )
-        # content according to pager and archive selected
-        rmas = rma_obj.search(
-            domain, order=order, limit=self._items_per_page, offset=pager["offset"]
-        )
+        archive_groups = self._get_archive_groups("rma", domain)
+        url_args = {"date_begin": date_begin, "date_end": date_end, "sortby": sortby}
+        pager = keyset = False
+        if sortby == "date":
+            # Keyset pagination: seek from the boundary RMA of the previous
+            # page instead of scanning an ever-growing OFFSET.
+            step = self._items_per_page
+            if before:
+                rmas = rma_obj.search(
+                    domain + self._get_keyset_domain(before, forward=False),
+                    order="date asc, id asc",
+                    limit=step + 1,
+                )
+                has_previous = len(rmas) > step
+                rmas = rmas[:step].sorted(lambda r: (r.date, r.id), reverse=True)
+                has_next = True
+            else:
+                rmas = rma_obj.search(
+                    domain + (self._get_keyset_domain(after) if after else []),
+                    order=order,
+                    limit=step + 1,
+                )
+                has_previous = bool(after)
+                has_next = len(rmas) > step
+                rmas = rmas[:step]
+            keyset = {"previous_url": False, "next_url": False}
+            if rmas and has_previous:
+                keyset["previous_url"] = "/my/rmas?%s" % url_encode(
+                    dict(url_args, before=self._get_keyset_cursor(rmas[0]))
+                )
+            if rmas and has_next:
+                keyset["next_url"] = "/my/rmas?%s" % url_encode(
+                    dict(url_args, after=self._get_keyset_cursor(rmas[-1]))
+                )
+        else:
+            # count for pager
+            rma_count = rma_obj.search_count(domain)
+            # pager
+            pager = portal_pager(
+                url="/my/rmas",
+                url_args=url_args,
+                total=rma_count,
+                page=page,
+                step=self._items_per_page,
+            )
+            # content according to pager and archive selected
+            rmas = rma_obj.search(
+                domain, order=order, limit=self._items_per_page, offset=pager["offset"]
+            )
         request.session["my_rmas_history"] = rmas.ids[:100]
         values.update(
             {
@@ -77,6 +145,7 @@ class PortalRma(CustomerPortal):
                 "rmas": rmas,
                 "page_name": "RMA",
                 "pager": pager,
+                "keyset": keyset,
                 "archive_groups": archive_groups,
                 "default_url": "/my/rmas",
                 "searchbar_sortings": searchbar_sortings,
@@ -117,13 +186,23 @@ class PortalRma(CustomerPortal):
             )
         except exceptions.AccessError:
             return request.redirect("/my")
-        report_sudo = request.env.ref("stock.action_report_delivery").sudo()
-        pdf = report_sudo.render_qweb_pdf([picking_sudo.id])[0]
-        pdfhttpheaders = [
-            ("Content-Type", "application/pdf"),
-            ("Content-Length", len(pdf)),
-        ]
-        return request.make_response(pdf, headers=pdfhttpheaders)
+        attachment = picking_sudo._get_rma_report_attachment()
+        if attachment.store_fname:
+            content = attachment._full_path(attachment.store_fname)
+        else:
+            content = io.BytesIO(base64.b64decode(attachment.datas))
+        # Served as a stream; If-None-Match/If-Modified-Since requests get
+        # a 304 while the cached slip isn't rendered again
+        response = http.send_file(
+            content,
+            mimetype="application/pdf",
+            filename=attachment.name,
+            mtime=attachment.write_date,
+            cache_timeout=0,
+        )
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
 
     def _picking_check_access(self, rma_id, picking_id, access_token=None):
         rma = request.env["rma"].browse([rma_id])
@@ -0,0 +1,21 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+from odoo import SUPERUSER_ID, api
+
+
+def migrate(cr, version):
+    """Backfill the delivered and remaining quantities of the RMAs that
+    have delivery moves."""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    cr.execute("SELECT DISTINCT rma_id FROM stock_move WHERE rma_id IS NOT NULL")
+    rmas = env["rma"].browse([row[0] for row in cr.fetchall()])
+    # add_to_compute doesn't cascade to the fields depending on the
+    # delivered quantities, so the remaining ones are added explicitly.
+    for fname in (
+        "delivered_qty",
+        "delivered_qty_done",
+        "remaining_qty",
+        "remaining_qty_to_done",
+    ):
+        env.add_to_compute(rmas._fields[fname], rmas)
+    rmas.recompute()
+    rmas.flush()
@@ -0,0 +1,23 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+
+def migrate(cr, version):
+    """Create the columns of the new stored quantity fields beforehand, so
+    the ORM doesn't compute them record by record on update. RMAs without
+    delivery moves are filled here and the rest in the post-migration."""
+    cr.execute(
+        """
+        ALTER TABLE rma
+            ADD COLUMN IF NOT EXISTS delivered_qty_done NUMERIC,
+            ADD COLUMN IF NOT EXISTS remaining_qty NUMERIC,
+            ADD COLUMN IF NOT EXISTS remaining_qty_to_done NUMERIC
+        """
+    )
+    cr.execute(
+        """
+        UPDATE rma
+        SET delivered_qty_done = 0,
+            remaining_qty = product_uom_qty - COALESCE(delivered_qty, 0),
+            remaining_qty_to_done = product_uom_qty
+        """
+    )
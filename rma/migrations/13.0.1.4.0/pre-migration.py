@@ -0,0 +1,20 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+
+def migrate(cr, version):
+    """Create and fill the column of the new stored commercial entity field
+    beforehand, so the ORM doesn't compute it record by record on update."""
+    cr.execute(
+        """
+        ALTER TABLE rma
+            ADD COLUMN IF NOT EXISTS commercial_partner_id INTEGER
+        """
+    )
+    cr.execute(
+        """
+        UPDATE rma
+        SET commercial_partner_id = rp.commercial_partner_id
+        FROM res_partner rp
+        WHERE rp.id = rma.partner_id
+        """
+    )
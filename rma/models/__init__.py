@@ -1,6 +1,9 @@
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
 from . import account_move
+from . import fetchmail_server
+from . import mail_thread
+from . import rma_count_mixin
 from . import rma
 from . import rma_operation
 from . import rma_tag
@@ -9,6 +12,7 @@ from . import res_company
 from . import res_config_settings
 from . import res_partner
 from . import res_users
+from . import stock_location
 from . import stock_move
 from . import stock_picking
 from . import stock_warehouse
@@ -0,0 +1,80 @@
+# Copyright 2026 Tecnativa
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import logging
+
+from odoo import models
+
+_logger = logging.getLogger(__name__)
+
+
+class FetchmailServer(models.Model):
+    _inherit = "fetchmail.server"
+
+    def fetch_mail(self):
+        """ The emails fetched from each server are collected by
+        [mail.thread].message_process and processed at the end in a single
+        batch, so the RMAs of a backlog of emails are created at once.
+        """
+        for server in self:
+            mail_batch = []
+            super(
+                FetchmailServer, server.with_context(rma_fetchmail_batch=mail_batch)
+            ).fetch_mail()
+            if mail_batch:
+                server._process_mail_batch(mail_batch)
+        return True
+
+    def _process_mail_batch(self, mail_batch):
+        """ Process the collected emails with [rma.team].message_process_batch.
+        If the batch fails, every email is processed on its own, so a faulty
+        email doesn't discard the rest of them.
+
+        :param mail_batch: list of tuples (model, message, save_original,
+                           strip_attachments) with the message_process
+                           arguments of each email
+        """
+        self.ensure_one()
+        thread_obj = self.env["mail.thread"].with_context(fetchmail_cron_running=True)
+        groups = {}
+        for model, message, save_original, strip_attachments in mail_batch:
+            key = (model, save_original, strip_attachments)
+            groups.setdefault(key, []).append(message)
+        teams = (
+            self.env["rma.team"].with_context(fetchmail_cron_running=True).search([])
+        )
+        for (model, save_original, strip_attachments), messages in groups.items():
+            try:
+                with self.env.cr.savepoint():
+                    teams.message_process_batch(
+                        messages,
+                        model=model,
+                        save_original=save_original,
+                        strip_attachments=strip_attachments,
+                    )
+                continue
+            except Exception:
+                _logger.info(
+                    "Failed to process a batch of %d emails from %s server %s, "
+                    "processing them one by one.",
+                    len(messages),
+                    self.server_type,
+                    self.name,
+                    exc_info=True,
+                )
+            for message in messages:
+                try:
+                    with self.env.cr.savepoint():
+                        thread_obj.message_process(
+                            model,
+                            message,
+                            save_original=save_original,
+                            strip_attachments=strip_attachments,
+                        )
+                except Exception:
+                    _logger.info(
+                        "Failed to process mail from %s server %s.",
+                        self.server_type,
+                        self.name,
+                        exc_info=True,
+                    )
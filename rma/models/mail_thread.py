@@ -0,0 +1,33 @@
+# Copyright 2026 Tecnativa
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import models
+
+
+class MailThread(models.AbstractModel):
+    _inherit = "mail.thread"
+
+    def message_process(
+        self,
+        model,
+        message,
+        custom_values=None,
+        save_original=False,
+        strip_attachments=False,
+        thread_id=None,
+    ):
+        """ Collect the emails fetched by [fetchmail.server].fetch_mail
+        instead of processing them one by one.
+        """
+        mail_batch = self.env.context.get("rma_fetchmail_batch")
+        if mail_batch is None or custom_values or thread_id:
+            return super().message_process(
+                model,
+                message,
+                custom_values=custom_values,
+                save_original=save_original,
+                strip_attachments=strip_attachments,
+                thread_id=thread_id,
+            )
+        mail_batch.append((model, message, save_original, strip_attachments))
+        return False
@@ -18,6 +18,12 @@ class Company(models.Model):
         help="When the delivery is confirmed, send a confirmation email "
         "to the customer.",
     )
+    rma_confirmation_mail_queued = fields.Boolean(
+        string="Queue RMA Confirmation Email",
+        help="Render the confirmation emails in batch and leave them in the "
+        "outgoing mail queue instead of sending them when the RMA is "
+        "confirmed.",
+    )
     rma_mail_confirmation_template_id = fields.Many2one(
         comodel_name="mail.template",
         string="Email Template confirmation for RMA",
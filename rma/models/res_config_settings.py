@@ -9,6 +9,22 @@ class ResConfigSettings(models.TransientModel):
     send_rma_confirmation = fields.Boolean(
         related="company_id.send_rma_confirmation", readonly=False,
     )
+    rma_confirmation_mail_queued = fields.Boolean(
+        related="company_id.rma_confirmation_mail_queued", readonly=False,
+    )
+    rma_confirmation_mail_queue_depth = fields.Integer(
+        string="Queued RMA emails", compute="_compute_rma_confirmation_mail_queue",
+    )
+    rma_confirmation_mail_queue_latency = fields.Integer(
+        string="Oldest queued RMA email (minutes)",
+        compute="_compute_rma_confirmation_mail_queue",
+    )
     rma_mail_confirmation_template_id = fields.Many2one(
         related="company_id.rma_mail_confirmation_template_id", readonly=False,
     )
+
+    def _compute_rma_confirmation_mail_queue(self):
+        stats = self.env["rma"]._get_confirmation_mail_queue_stats()
+        for record in self:
+            record.rma_confirmation_mail_queue_depth = stats["depth"]
+            record.rma_confirmation_mail_queue_latency = stats["latency"] // 60
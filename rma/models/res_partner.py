@@ -5,29 +5,29 @@ from odoo import fields, models
 
 
 class ResPartner(models.Model):
-    _inherit = "res.partner"
+    _name = "res.partner"
+    _inherit = ["res.partner", "rma.count.mixin"]
+    _rma_count_field = "partner_id"
 
     rma_ids = fields.One2many(
         comodel_name="rma", inverse_name="partner_id", string="RMAs",
     )
-    rma_count = fields.Integer(string="RMA count", compute="_compute_rma_count",)
+    rma_commercial_count = fields.Integer(
+        string="Commercial entity RMA count",
+        compute="_compute_rma_commercial_count",
+        help="RMAs of the commercial entity of the partner and all its contacts",
+    )
 
-    def _compute_rma_count(self):
-        rma_data = self.env["rma"].read_group(
-            [("partner_id", "in", self.ids)], ["partner_id"], ["partner_id"]
-        )
-        mapped_data = {r["partner_id"][0]: r["partner_id_count"] for r in rma_data}
+    def _compute_rma_commercial_count(self):
+        commercial_partners = self.mapped("commercial_partner_id")
+        counts = commercial_partners._get_rma_counts("commercial_partner_id")
         for record in self:
-            record.rma_count = mapped_data.get(record.id, 0)
+            record.rma_commercial_count = counts.get(record.commercial_partner_id.id, 0)
 
-    def action_view_rma(self):
+    def action_view_commercial_rma(self):
         self.ensure_one()
         action = self.env.ref("rma.rma_action").read()[0]
-        rma = self.rma_ids
-        if len(rma) == 1:
-            action.update(
-                res_id=rma.id, view_mode="form", view_id=False, views=False,
-            )
-        else:
-            action["domain"] = [("partner_id", "in", self.ids)]
+        action["domain"] = [
+            ("commercial_partner_id", "=", self.commercial_partner_id.id)
+        ]
         return action
@@ -1,15 +1,17 @@
 # Copyright 2020 Tecnativa - Ernesto Tejeda
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+import logging
 from collections import Counter
 
 from odoo import _, api, fields, models
 from odoo.exceptions import AccessError, ValidationError
-from odoo.tests import Form
-from odoo.tools import html2plaintext
+from odoo.tools import float_round, html2plaintext
 
 from odoo.addons.stock.models.stock_move import PROCUREMENT_PRIORITIES
 
+_logger = logging.getLogger(__name__)
+
 
 class Rma(models.Model):
     _name = "rma"
@@ -18,8 +20,8 @@ class Rma(models.Model):
     _inherit = ["mail.thread", "portal.mixin", "mail.activity.mixin"]
 
     def _domain_location_id(self):
-        rma_loc = self.env["stock.warehouse"].search([]).mapped("rma_loc_id")
-        return [("id", "child_of", rma_loc.ids)]
+        rma_loc_ids = self.env["stock.warehouse"]._get_rma_root_location_ids()
+        return [("id", "child_of", rma_loc_ids)]
 
     # General fields
     sent = fields.Boolean()
@@ -90,7 +92,11 @@ class Rma(models.Model):
         help="Refund address for current RMA.",
     )
     commercial_partner_id = fields.Many2one(
-        comodel_name="res.partner", related="partner_id.commercial_partner_id",
+        comodel_name="res.partner",
+        related="partner_id.commercial_partner_id",
+        string="Commercial entity",
+        store=True,
+        index=True,
     )
     picking_id = fields.Many2one(
         comodel_name="stock.picking",
@@ -217,7 +223,7 @@ class Rma(models.Model):
         string="Delivered qty done",
         digits="Product Unit of Measure",
         compute="_compute_delivered_qty",
-        compute_sudo=True,
+        store=True,
     )
     can_be_returned = fields.Boolean(compute="_compute_can_be_returned",)
     can_be_replaced = fields.Boolean(compute="_compute_can_be_replaced",)
@@ -226,11 +232,13 @@ class Rma(models.Model):
         string="Remaining delivered qty",
         digits="Product Unit of Measure",
         compute="_compute_remaining_qty",
+        store=True,
     )
     remaining_qty_to_done = fields.Float(
         string="Remaining delivered qty to done",
         digits="Product Unit of Measure",
         compute="_compute_remaining_qty",
+        store=True,
     )
     # Split fields
     can_be_split = fields.Boolean(compute="_compute_can_be_split",)
@@ -275,29 +283,30 @@ class Rma(models.Model):
         taken. This field is used to control when the RMA cam be set
         to 'delivered' state.
         """
+        to_convert = []
         for record in self:
-            delivered_qty = 0.0
-            delivered_qty_done = 0.0
             for move in record.delivery_move_ids.filtered(
                 lambda r: r.state != "cancel" and not r.scrapped
             ):
                 if move.quantity_done:
-                    quantity_done = move.product_uom._compute_quantity(
-                        move.quantity_done, record.product_uom
-                    )
-                    if move.state == "done":
-                        delivered_qty_done += quantity_done
-                    delivered_qty += quantity_done
+                    qty, is_done = move.quantity_done, move.state == "done"
                 elif move.reserved_availability:
-                    delivered_qty += move.product_uom._compute_quantity(
-                        move.reserved_availability, record.product_uom
-                    )
+                    qty, is_done = move.reserved_availability, False
                 elif move.product_uom_qty:
-                    delivered_qty += move.product_uom._compute_quantity(
-                        move.product_uom_qty, record.product_uom
-                    )
-            record.delivered_qty = delivered_qty
-            record.delivered_qty_done = delivered_qty_done
+                    qty, is_done = move.product_uom_qty, False
+                else:
+                    continue
+                to_convert.append(
+                    (record, is_done, qty, move.product_uom.id, record.product_uom.id)
+                )
+        converted = self._convert_uom_quantities([item[2:] for item in to_convert])
+        quantities = {record: [0.0, 0.0] for record in self}
+        for (record, is_done, *__), qty in zip(to_convert, converted):
+            quantities[record][0] += qty
+            if is_done:
+                quantities[record][1] += qty
+        for record in self:
+            record.delivered_qty, record.delivered_qty_done = quantities[record]
 
     @api.depends("product_uom_qty", "delivered_qty", "delivered_qty_done")
     def _compute_remaining_qty(self):
@@ -383,10 +392,12 @@ class Rma(models.Model):
 
     @api.depends("location_id")
     def _compute_warehouse_id(self):
-        for record in self.filtered("location_id"):
-            record.warehouse_id = self.env["stock.warehouse"].search(
-                [("rma_loc_id", "parent_of", record.location_id.id)], limit=1
-            )
+        records = self.filtered("location_id")
+        warehouses = self.env["stock.warehouse"]._get_warehouses_by_rma_location(
+            records.mapped("location_id")
+        )
+        for record in records:
+            record.warehouse_id = warehouses[record.location_id.id]
 
     def _compute_access_url(self):
         for record in self:
@@ -473,36 +484,34 @@ class Rma(models.Model):
             ):
                 # If this condition is True, it is because a picking is not set
                 company = self.company_id or self.env.company
-                warehouse = self.env["stock.warehouse"].search(
-                    [("company_id", "=", company.id)], limit=1
-                )
+                warehouse = self.env["stock.warehouse"]._get_company_warehouse(company)
                 self.location_id = warehouse.rma_loc_id.id
         return {"domain": {"product_uom": domain_product_uom}}
 
     # CRUD methods (ORM overrides)
     @api.model_create_multi
     def create(self, vals_list):
+        to_name = {}
         for vals in vals_list:
             if vals.get("name", _("New")) == _("New"):
-                ir_sequence = self.env["ir.sequence"]
-                if "company_id" in vals:
-                    ir_sequence = ir_sequence.with_context(
-                        force_company=vals["company_id"]
-                    )
-                vals["name"] = ir_sequence.next_by_code("rma")
-            # Assign a default team_id which will be the first in the sequence
-            if "team_id" not in vals:
-                vals["team_id"] = self.env["rma.team"].search([], limit=1).id
+                company_id = vals.get("company_id") or self.env.company.id
+                to_name.setdefault(company_id, [])
+                to_name[company_id].append(vals)
+        for company_id, company_vals_list in to_name.items():
+            names = self._next_sequence_names(company_id, len(company_vals_list))
+            for vals, name in zip(company_vals_list, names):
+                vals["name"] = name
+        # Assign a default team_id which will be the first in the sequence
+        if any("team_id" not in vals for vals in vals_list):
+            default_team_id = self.env["rma.team"].search([], limit=1).id
+            for vals in vals_list:
+                vals.setdefault("team_id", default_team_id)
         return super().create(vals_list)
 
     def copy(self, default=None):
-        team = super().copy(default)
-        for follower in self.message_follower_ids:
-            team.message_subscribe(
-                partner_ids=follower.partner_id.ids,
-                subtype_ids=follower.subtype_ids.ids,
-            )
-        return team
+        rma = super().copy(default)
+        self._message_copy_followers(rma)
+        return rma
 
     def unlink(self):
         if self.filtered(lambda r: r.state != "draft"):
@@ -512,14 +521,65 @@ class Rma(models.Model):
         return super().unlink()
 
     def _send_confirmation_email(self):
-        """Auto send notifications"""
-        for rma in self.filtered(lambda p: p.company_id.send_rma_confirmation):
+        """Auto send notifications.
+
+        When the company queues them, the emails are rendered in batch per
+        template and left in the mail queue, to be sent by the mail queue
+        cron instead of during the confirmation.
+        """
+        rmas = self.filtered(lambda p: p.company_id.send_rma_confirmation)
+        queued = rmas.filtered(lambda r: r.company_id.rma_confirmation_mail_queued)
+        subtype_id = self.env.ref("rma.mt_rma_notification").id
+        for rma in rmas - queued:
             rma_template_id = rma.company_id.rma_mail_confirmation_template_id.id
             rma.with_context(
-                force_send=True,
-                mark_rma_as_sent=True,
-                default_subtype_id=self.env.ref("rma.mt_rma_notification").id,
+                force_send=True, mark_rma_as_sent=True, default_subtype_id=subtype_id,
             ).message_post_with_template(rma_template_id)
+        template_dict = {}
+        for rma in queued:
+            template = rma.company_id.rma_mail_confirmation_template_id
+            template_dict.setdefault(template, self.env["rma"])
+            template_dict[template] |= rma
+        for template, template_rmas in template_dict.items():
+            if not template:
+                continue
+            template_rmas.write({"sent": True})
+            template_rmas.with_context(
+                active_ids=template_rmas.ids, default_subtype_id=subtype_id,
+            ).message_post_with_template(template.id, composition_mode="mass_post")
+            _logger.info(
+                "%d RMA confirmation emails queued with template %s",
+                len(template_rmas),
+                template.name,
+            )
+        if template_dict:
+            stats = self._get_confirmation_mail_queue_stats()
+            _logger.info(
+                "RMA confirmation mail queue: %d emails waiting, "
+                "the oldest one for %d seconds",
+                stats["depth"],
+                stats["latency"],
+            )
+
+    @api.model
+    def _get_confirmation_mail_queue_stats(self):
+        """ Depth and latency of the queue of RMA confirmation emails that
+        are waiting for the mail queue cron.
+
+        :return: dict with 'depth' (number of outgoing emails) and
+                 'latency' (age in seconds of the oldest one)
+        """
+        domain = [
+            ("state", "=", "outgoing"),
+            ("model", "=", self._name),
+            ("subtype_id", "=", self.env.ref("rma.mt_rma_notification").id),
+        ]
+        mail_obj = self.env["mail.mail"].sudo()
+        oldest = mail_obj.search(domain, order="create_date", limit=1)
+        latency = 0.0
+        if oldest:
+            latency = (fields.Datetime.now() - oldest.create_date).total_seconds()
+        return {"depth": mail_obj.search_count(domain), "latency": latency}
 
     # Action methods
     def action_rma_send(self):
@@ -550,18 +610,27 @@ class Rma(models.Model):
         }
 
     def action_confirm(self):
-        """Invoked when 'Confirm' button in rma form view is clicked."""
-        self.ensure_one()
+        """Invoked when 'Confirm' button in rma form view is clicked.
+
+        It can be run on several RMAs at once. The RMAs that are not
+        linked to an origin delivery are grouped and one reception
+        picking is created per group (see _create_receptions_from_product).
+        """
         self._ensure_required_fields()
-        if self.state == "draft":
-            if self.picking_id:
-                reception_move = self._create_receptions_from_picking()
-            else:
-                reception_move = self._create_receptions_from_product()
-            self.write({"reception_move_id": reception_move.id, "state": "confirmed"})
-            if self.partner_id not in self.message_partner_ids:
-                self.message_subscribe([self.partner_id.id])
-            self._send_confirmation_email()
+        rmas = self.filtered(lambda r: r.state == "draft")
+        if not rmas:
+            return
+        from_picking = rmas.filtered("picking_id")
+        from_picking._create_receptions_from_picking()
+        (rmas - from_picking)._create_receptions_from_product()
+        rmas.write({"state": "confirmed"})
+        partner_dict = {}
+        for rma in rmas.filtered(lambda r: r.partner_id not in r.message_partner_ids):
+            partner_dict.setdefault(rma.partner_id, self.env["rma"])
+            partner_dict[rma.partner_id] |= rma
+        for partner, partner_rmas in partner_dict.items():
+            partner_rmas.message_subscribe(partner.ids)
+        rmas._send_confirmation_email()
 
     def action_refund(self):
         """Invoked when 'Refund' button in rma form view is clicked
@@ -574,33 +643,24 @@ class Rma(models.Model):
             group_dict[key] |= record
         for rmas in group_dict.values():
             origin = ", ".join(rmas.mapped("name"))
-            invoice_form = Form(
-                self.env["account.move"].with_context(
-                    default_type="out_refund", company_id=rmas[0].company_id.id,
-                ),
-                "account.view_move_form",
+            refund_vals = rmas[0]._prepare_refund_vals(origin)
+            fiscal_position = self.env["account.fiscal.position"].browse(
+                refund_vals.get("fiscal_position_id")
             )
-            rmas[0]._prepare_refund(invoice_form, origin)
-            refund = invoice_form.save()
-            for rma in rmas:
-                # For each iteration the Form is edited, a new invoice line
-                # is added and then saved. This is to generate the other
-                # lines of the accounting entry and to specify the associated
-                # RMA to that new invoice line.
-                invoice_form = Form(refund)
-                with invoice_form.invoice_line_ids.new() as line_form:
-                    rma._prepare_refund_line(line_form)
-                refund = invoice_form.save()
-                line = refund.invoice_line_ids.filtered(lambda r: not r.rma_id)
-                line.rma_id = rma.id
-                rma.write(
-                    {
-                        "refund_line_id": line.id,
-                        "refund_id": refund.id,
-                        "state": "refunded",
-                    }
+            # All the lines are created at once so the accounting entry
+            # lines (taxes, receivable...) are computed only once.
+            refund_vals["invoice_line_ids"] = [
+                (0, 0, rma._prepare_refund_line_vals(fiscal_position)) for rma in rmas
+            ]
+            refund = (
+                self.env["account.move"]
+                .with_context(
+                    default_type="out_refund", company_id=rmas[0].company_id.id,
                 )
-            refund.invoice_origin = origin
+                .create(refund_vals)
+            )
+            rmas.write({"refund_id": refund.id, "state": "refunded"})
+            rmas._link_refund_lines(refund)
             refund.message_post_with_view(
                 "mail.message_origin_link",
                 values={"self": refund, "origin": rmas},
@@ -811,7 +871,9 @@ class Rma(models.Model):
         """
         if qty and uom:
             if uom != self.product_uom:
-                qty = uom._compute_quantity(qty, self.product_uom)
+                qty = self._convert_uom_quantities(
+                    [(qty, uom.id, self.product_uom.id)]
+                )[0]
             if qty > self.remaining_qty:
                 raise ValidationError(
                     _("The quantity to return is greater than " "remaining quantity.")
@@ -823,7 +885,9 @@ class Rma(models.Model):
         """
         to_split_uom_qty = qty
         if uom != self.product_uom:
-            to_split_uom_qty = uom._compute_quantity(qty, self.product_uom)
+            to_split_uom_qty = self._convert_uom_quantities(
+                [(qty, uom.id, self.product_uom.id)]
+            )[0]
         if to_split_uom_qty > self.remaining_qty:
             raise ValidationError(
                 _(
@@ -835,23 +899,62 @@ class Rma(models.Model):
 
     # Reception business methods
     def _create_receptions_from_picking(self):
-        self.ensure_one()
+        """ Create the reception moves of RMAs linked to an origin delivery.
+        RMAs are grouped by delivery picking and RMA location, so a single
+        return wizard is run and a single return picking is created per
+        group. RMAs returning the same delivery move are spread over
+        several return pickings, as the return wizard only has one line
+        per move.
+
+        invoked by:
+        rma.action_confirm
+        """
+        group_dict = {}
+        for record in self:
+            key = (record.picking_id.id, record.location_id.id)
+            group_dict.setdefault(key, {})
+            group_dict[key].setdefault(record.move_id.id, []).append(record.id)
+        stock_move = self.env["stock.move"]
+        moves = stock_move
+        for rmas_by_move in group_dict.values():
+            # Each return picking only holds one RMA per delivery move
+            while rmas_by_move:
+                rma_ids = [ids.pop(0) for ids in rmas_by_move.values()]
+                rmas_by_move = {
+                    move_id: ids for move_id, ids in rmas_by_move.items() if ids
+                }
+                moves |= self.browse(rma_ids)._create_return_picking()
+        return moves
+
+    def _create_return_picking(self):
+        """ Create one return picking of the origin delivery of the RMAs in
+        self through the stock return wizard. All the RMAs must share
+        the same delivery picking and RMA location and must return
+        different delivery moves.
+
+        invoked by:
+        rma._create_receptions_from_picking
+        """
+        first = self[0]
         create_vals = {}
-        if self.location_id:
+        if first.location_id:
             create_vals.update(
-                location_id=self.location_id.id, picking_id=self.picking_id.id,
+                location_id=first.location_id.id, picking_id=first.picking_id.id,
             )
         return_wizard = (
             self.env["stock.return.picking"]
-            .with_context(active_id=self.picking_id.id, active_ids=self.picking_id.ids,)
+            .with_context(
+                active_id=first.picking_id.id, active_ids=first.picking_id.ids,
+            )
             .create(create_vals)
         )
         return_wizard._onchange_picking_id()
+        rma_by_move = {rma.move_id: rma for rma in self}
         return_wizard.product_return_moves.filtered(
-            lambda r: r.move_id != self.move_id
+            lambda r: r.move_id not in rma_by_move
         ).unlink()
-        return_line = return_wizard.product_return_moves
-        return_line.quantity = self.product_uom_qty
+        for return_line in return_wizard.product_return_moves:
+            return_line.quantity = rma_by_move[return_line.move_id].product_uom_qty
         # set_rma_picking_type is to override the copy() method of stock
         # picking and change the default picking type to rma picking type.
         picking_action = return_wizard.with_context(
@@ -859,78 +962,157 @@ class Rma(models.Model):
         ).create_returns()
         picking_id = picking_action["res_id"]
         picking = self.env["stock.picking"].browse(picking_id)
-        picking.origin = "{} ({})".format(self.name, picking.origin)
-        move = picking.move_lines
-        move.priority = self.priority
-        return move
+        picking.origin = "{} ({})".format(
+            ", ".join(self.mapped("name")), picking.origin
+        )
+        priority_dict = {}
+        for move in picking.move_lines:
+            rma = rma_by_move[move.origin_returned_move_id]
+            rma.reception_move_id = move
+            priority_dict.setdefault(rma.priority, self.env["stock.move"])
+            priority_dict[rma.priority] |= move
+        for priority, moves in priority_dict.items():
+            moves.write({"priority": priority})
+        return picking.move_lines
 
     def _create_receptions_from_product(self):
+        """ Create the reception moves of RMAs not linked to an origin
+        delivery. RMAs are grouped by shipping address, warehouse, company
+        and RMA location, so only one picking is created, confirmed and
+        reserved per group. Every RMA gets its own reception move, which
+        is linked to it before confirming the picking to avoid the moves
+        of the same product being merged.
+
+        invoked by:
+        rma.action_confirm
+        """
+        group_dict = {}
+        for record in self:
+            key = (
+                record.partner_shipping_id.id,
+                record.warehouse_id.id,
+                record.company_id.id,
+                record.location_id.id,
+            )
+            group_dict.setdefault(key, self.env["rma"])
+            group_dict[key] |= record
+        stock_move = self.env["stock.move"]
+        moves = stock_move
+        for rmas in group_dict.values():
+            origin = ", ".join(rmas.mapped("name"))
+            picking = self.env["stock.picking"].create(
+                rmas[0]._prepare_picking_vals(origin)
+            )
+            group_moves = stock_move.create(
+                [rma._prepare_reception_move_vals(picking) for rma in rmas]
+            )
+            for rma, move in zip(rmas, group_moves):
+                rma.reception_move_id = move
+            picking.action_confirm()
+            picking.action_assign()
+            picking.message_post_with_view(
+                "mail.message_origin_link",
+                values={"self": picking, "origin": rmas},
+                subtype_id=self.env.ref("mail.mt_note").id,
+            )
+            moves |= group_moves
+        return moves
+
+    def _prepare_picking_vals(self, origin=None):
+        """ Hook method for preparing the values of a reception picking.
+
+        invoked by:
+        rma._create_receptions_from_product
+        """
         self.ensure_one()
-        picking_form = Form(
-            recordp=self.env["stock.picking"].with_context(
-                default_picking_type_id=self.warehouse_id.rma_in_type_id.id
-            ),
-            view="stock.view_picking_form",
-        )
-        self._prepare_picking(picking_form)
-        picking = picking_form.save()
-        picking.action_confirm()
-        picking.action_assign()
-        picking.message_post_with_view(
-            "mail.message_origin_link",
-            values={"self": picking, "origin": self},
-            subtype_id=self.env.ref("mail.mt_note").id,
-        )
-        return picking.move_lines
+        return {
+            "picking_type_id": self.warehouse_id.rma_in_type_id.id,
+            "origin": origin or self.name,
+            "partner_id": self.partner_shipping_id.id,
+            "location_id": self.partner_shipping_id.property_stock_customer.id,
+            "location_dest_id": self.location_id.id,
+        }
 
-    def _prepare_picking(self, picking_form):
-        picking_form.origin = self.name
-        picking_form.partner_id = self.partner_shipping_id
-        picking_form.location_id = self.partner_shipping_id.property_stock_customer
-        picking_form.location_dest_id = self.location_id
-        with picking_form.move_ids_without_package.new() as move_form:
-            move_form.product_id = self.product_id
-            move_form.product_uom_qty = self.product_uom_qty
-            move_form.product_uom = self.product_uom
+    def _prepare_reception_move_vals(self, picking):
+        """ Hook method for preparing the values of the reception move of
+        an RMA in the given picking.
+
+        invoked by:
+        rma._create_receptions_from_product
+        """
+        self.ensure_one()
+        return {
+            "name": self.product_id.partner_ref,
+            "product_id": self.product_id.id,
+            "product_uom_qty": self.product_uom_qty,
+            "product_uom": self.product_uom.id,
+            "picking_id": picking.id,
+            "picking_type_id": picking.picking_type_id.id,
+            "location_id": picking.location_id.id,
+            "location_dest_id": picking.location_dest_id.id,
+            "partner_id": picking.partner_id.id,
+            "company_id": picking.company_id.id,
+        }
 
     # Extract business methods
     def extract_quantity(self, qty, uom):
+        return self.extract_quantities([qty], uom)
+
+    def extract_quantities(self, quantities, uom):
+        """ Split one new RMA out of this one for each quantity in
+        'quantities' (expressed in 'uom'). The new RMAs are created at once,
+        the followers are copied with a single insert and the quantity and
+        state of this RMA are updated once.
+
+        :return: the extracted RMAs, in the same order as 'quantities'
+        """
         self.ensure_one()
         self._ensure_can_be_split()
-        self._ensure_qty_to_extract(qty, uom)
-        self.product_uom_qty -= uom._compute_quantity(qty, self.product_uom)
-        if self.remaining_qty_to_done <= 0:
+        self._ensure_qty_to_extract(sum(quantities), uom)
+        extracted_qty = sum(
+            self._convert_uom_quantities(
+                [(qty, uom.id, self.product_uom.id) for qty in quantities]
+            )
+        )
+        vals = {"product_uom_qty": self.product_uom_qty - extracted_qty}
+        if vals["product_uom_qty"] - self.delivered_qty_done <= 0:
             if self.state == "waiting_return":
-                self.state = "returned"
+                vals["state"] = "returned"
             elif self.state == "waiting_replacement":
-                self.state = "replaced"
-        extracted_rma = self.copy(
+                vals["state"] = "replaced"
+        self.write(vals)
+        copy_vals = self.copy_data(
             {
                 "origin": self.name,
-                "product_uom_qty": qty,
                 "product_uom": uom.id,
                 "state": "received",
                 "reception_move_id": self.reception_move_id.id,
                 "origin_split_rma_id": self.id,
             }
+        )[0]
+        extracted_rmas = self.create(
+            [dict(copy_vals, product_uom_qty=qty) for qty in quantities]
         )
-        extracted_rma.message_post_with_view(
-            "mail.message_origin_link",
-            values={"self": extracted_rma, "origin": self},
-            subtype_id=self.env.ref("mail.mt_note").id,
+        self._message_copy_followers(extracted_rmas)
+        body = self.env.ref("mail.message_origin_link").render(
+            {"self": extracted_rmas, "origin": self},
+            engine="ir.qweb",
+            minimal_qcontext=True,
         )
+        extracted_rmas._message_log_batch({rma.id: body for rma in extracted_rmas})
         self.message_post(
-            body=_(
-                'Split: <a href="#" data-oe-model="rma" '
-                'data-oe-id="%d">%s</a> has been created.'
+            body=_("Split: %s has been created.")
+            % ", ".join(
+                '<a href="#" data-oe-model="rma" data-oe-id="%d">%s</a>'
+                % (rma.id, rma.name)
+                for rma in extracted_rmas
             )
-            % (extracted_rma.id, extracted_rma.name,)
         )
-        return extracted_rma
+        return extracted_rmas
 
     # Refund business methods
-    def _prepare_refund(self, invoice_form, origin):
-        """ Hook method for preparing the refund Form.
+    def _prepare_refund_vals(self, origin=False):
+        """ Hook method for preparing the values of the refund.
 
         This method could be override in order to add new custom field
         values in the refund creation.
@@ -939,10 +1121,74 @@ class Rma(models.Model):
         rma.action_refund
         """
         self.ensure_one()
-        invoice_form.partner_id = self.partner_invoice_id
+        partner = self.partner_invoice_id
+        delivery_partner = partner.address_get(["delivery"])["delivery"]
+        fiscal_position_id = (
+            self.env["account.fiscal.position"]
+            .with_context(force_company=self.company_id.id)
+            .get_fiscal_position(partner.id, delivery_id=delivery_partner)
+        )
+        partner = partner.with_context(force_company=self.company_id.id)
+        return {
+            "type": "out_refund",
+            "partner_id": partner.id,
+            "fiscal_position_id": fiscal_position_id,
+            "invoice_payment_term_id": partner.property_payment_term_id.id,
+            "invoice_origin": origin,
+        }
+
+    def _link_refund_lines(self, refund):
+        """ Link every RMA in self to the line of the refund that was created
+        for it, with a single update for the whole refund.
+
+        invoked by:
+        rma.action_refund
+        """
+        line_by_rma = {
+            line.rma_id.id: line.id
+            for line in refund.invoice_line_ids
+            if line.rma_id in self
+        }
+        if not line_by_rma:
+            return
+        self.flush(["refund_line_id"])
+        self.env.cr.execute(
+            """
+            UPDATE rma
+            SET refund_line_id = data.line_id
+            FROM (SELECT unnest(%s) AS rma_id, unnest(%s) AS line_id) AS data
+            WHERE rma.id = data.rma_id
+            """,
+            (list(line_by_rma), list(line_by_rma.values())),
+        )
+        linked_rmas = self.browse(list(line_by_rma))
+        linked_rmas.invalidate_cache(["refund_line_id"], linked_rmas.ids)
+        linked_rmas.modified(["refund_line_id"])
 
-    def _prepare_refund_line(self, line_form):
-        """ Hook method for preparing a refund line Form.
+    def _get_refund_line_taxes(self, product, fiscal_position=None):
+        """ Taxes of a refund line, falling back, as the invoice line
+        onchange does, to the taxes of the income account and then to the
+        default sale tax of the company when the product has none.
+
+        invoked by:
+        rma._prepare_refund_line_vals
+        """
+        self.ensure_one()
+        if product.taxes_id:
+            taxes = product.taxes_id.filtered(lambda r: r.company_id == self.company_id)
+        else:
+            accounts = product.product_tmpl_id.with_context(
+                force_company=self.company_id.id
+            ).get_product_accounts(fiscal_pos=fiscal_position)
+            taxes = accounts["income"].tax_ids
+        if not taxes:
+            taxes = self.company_id.account_sale_tax_id
+        if taxes and fiscal_position:
+            taxes = fiscal_position.map_tax(taxes, product, self.partner_invoice_id)
+        return taxes
+
+    def _prepare_refund_line_vals(self, fiscal_position=None):
+        """ Hook method for preparing the values of a refund line.
 
         This method could be override in order to add new custom field
         values in the refund line creation.
@@ -953,10 +1199,17 @@ class Rma(models.Model):
         self.ensure_one()
         product = self._get_refund_line_product()
         qty, uom = self._get_refund_line_quantity()
-        line_form.product_id = product
-        line_form.quantity = qty
-        line_form.product_uom_id = uom
-        line_form.price_unit = self._get_refund_line_price_unit()
+        taxes = self._get_refund_line_taxes(product, fiscal_position)
+        vals = {
+            "product_id": product.id,
+            "quantity": qty,
+            "product_uom_id": uom.id,
+            "price_unit": self._get_refund_line_price_unit(),
+            "tax_ids": [(6, 0, taxes.ids)],
+            "rma_id": self.id,
+        }
+        vals.update(self._get_extra_refund_line_vals())
+        return vals
 
     def _get_refund_line_product(self):
         """To be overriden in a third module with the proper origin values
@@ -992,138 +1245,190 @@ class Rma(models.Model):
             )
             group_dict.setdefault(key, self.env["rma"])
             group_dict[key] |= record
+        stock_move = self.env["stock.move"].sudo()
+        note_subtype_id = self.env.ref("mail.mt_note").id
         for rmas in group_dict.values():
             origin = ", ".join(rmas.mapped("name"))
-            rma_out_type = rmas[0].warehouse_id.rma_out_type_id
-            picking_form = Form(
-                recordp=self.env["stock.picking"].with_context(
-                    default_picking_type_id=rma_out_type.id
-                ),
-                view="stock.view_picking_form",
+            picking = self.env["stock.picking"].create(
+                rmas[0]._prepare_returning_picking_vals(origin)
+            )
+            stock_move.create(
+                [
+                    rma._prepare_returning_move_vals(picking, scheduled_date, qty, uom)
+                    for rma in rmas
+                ]
             )
-            rmas[0]._prepare_returning_picking(picking_form, origin)
-            picking = picking_form.save()
-            for rma in rmas:
-                with picking_form.move_ids_without_package.new() as move_form:
-                    rma._prepare_returning_move(move_form, scheduled_date, qty, uom)
-                # rma_id is not present in the form view, so we need to get
-                # the 'values to save' to add the rma id and use the
-                # create method intead of save the form.
-                picking_vals = picking_form._values_to_save(all_fields=True)
-                move_vals = picking_vals["move_ids_without_package"][-1][2]
-                move_vals.update(
-                    picking_id=picking.id,
-                    rma_id=rma.id,
-                    move_orig_ids=[(4, rma.reception_move_id.id)],
-                    company_id=picking.company_id.id,
-                )
-                self.env["stock.move"].sudo().create(move_vals)
-                rma.message_post(
-                    body=_(
-                        'Return: <a href="#" data-oe-model="stock.picking" '
-                        'data-oe-id="%d">%s</a> has been created.'
-                    )
-                    % (picking.id, picking.name)
-                )
             picking.action_confirm()
             picking.action_assign()
             picking.message_post_with_view(
                 "mail.message_origin_link",
                 values={"self": picking, "origin": rmas},
-                subtype_id=self.env.ref("mail.mt_note").id,
+                subtype_id=note_subtype_id,
             )
+            # The same note is logged in all the RMAs of the picking at once
+            body = _(
+                'Return: <a href="#" data-oe-model="stock.picking" '
+                'data-oe-id="%d">%s</a> has been created.'
+            ) % (picking.id, picking.name)
+            rmas._message_log_batch({rma.id: body for rma in rmas})
         rmas_to_return.write({"state": "waiting_return"})
 
-    def _prepare_returning_picking(self, picking_form, origin=None):
-        picking_form.picking_type_id = self.warehouse_id.rma_out_type_id
-        picking_form.origin = origin or self.name
-        picking_form.partner_id = self.partner_shipping_id
+    def _prepare_returning_picking_vals(self, origin=None):
+        """ Hook method for preparing the values of a returning picking.
 
-    def _prepare_returning_move(
-        self, move_form, scheduled_date, quantity=None, uom=None
+        invoked by:
+        rma.create_return
+        """
+        self.ensure_one()
+        picking_type = self.warehouse_id.rma_out_type_id
+        return {
+            "picking_type_id": picking_type.id,
+            "origin": origin or self.name,
+            "partner_id": self.partner_shipping_id.id,
+            "location_id": picking_type.default_location_src_id.id,
+            "location_dest_id": self.partner_shipping_id.property_stock_customer.id,
+        }
+
+    def _prepare_returning_move_vals(
+        self, picking, scheduled_date, quantity=None, uom=None
     ):
-        move_form.product_id = self.product_id
-        move_form.product_uom_qty = quantity or self.product_uom_qty
-        move_form.product_uom = uom or self.product_uom
-        move_form.date_expected = scheduled_date
+        """ Hook method for preparing the values of the move that returns
+        the product of an RMA to the customer in the given picking.
+
+        invoked by:
+        rma.create_return
+        """
+        self.ensure_one()
+        return {
+            "name": self.product_id.partner_ref,
+            "product_id": self.product_id.id,
+            "product_uom_qty": quantity or self.product_uom_qty,
+            "product_uom": (uom or self.product_uom).id,
+            "date_expected": scheduled_date,
+            "picking_id": picking.id,
+            "picking_type_id": picking.picking_type_id.id,
+            "location_id": picking.location_id.id,
+            "location_dest_id": picking.location_dest_id.id,
+            "partner_id": picking.partner_id.id,
+            "company_id": picking.company_id.id,
+            "rma_id": self.id,
+            "move_orig_ids": [(4, self.reception_move_id.id)],
+        }
 
     # Replacing business methods
     def create_replace(self, scheduled_date, warehouse, product, qty, uom):
-        """Intended to be invoked by the delivery wizard"""
-        self.ensure_one()
+        """Intended to be invoked by the delivery wizard.
+
+        When a product is given, the RMAs are replaced with that product
+        and quantity. Otherwise (mass replacement) each RMA is replaced with
+        its own product and remaining quantity. All the procurements are
+        run together and the new moves are mapped back to their RMA.
+        """
         self._ensure_can_be_replaced()
-        moves_before = self.delivery_move_ids
-        self._action_launch_stock_rule(scheduled_date, warehouse, product, qty, uom)
-        new_move = self.delivery_move_ids - moves_before
-        if new_move:
-            self.reception_move_id.move_dest_ids = [(4, new_move.id)]
-            self.message_post(
-                body=_(
-                    "Replacement: "
-                    'Move <a href="#" data-oe-model="stock.move" '
-                    'data-oe-id="%d">%s</a> (Picking <a href="#" '
-                    'data-oe-model="stock.picking" data-oe-id="%d">%s</a>) '
-                    "has been created."
-                )
-                % (
-                    new_move.id,
-                    new_move.name_get()[0][1],
-                    new_move.picking_id.id,
-                    new_move.picking_id.name,
+        replace_data = {}
+        for rma in self.filtered("can_be_replaced"):
+            if product:
+                replace_data[rma] = (product, qty, uom)
+            elif rma.remaining_qty > 0:
+                replace_data[rma] = (rma.product_id, rma.remaining_qty, rma.product_uom)
+        rmas = self.env["rma"].concat(*replace_data)
+        moves_before = rmas.mapped("delivery_move_ids")
+        rmas._action_launch_stock_rule(scheduled_date, warehouse, replace_data)
+        new_moves_dict = {}
+        for move in rmas.mapped("delivery_move_ids") - moves_before:
+            new_moves_dict.setdefault(move.rma_id, self.env["stock.move"])
+            new_moves_dict[move.rma_id] |= move
+        bodies = {}
+        for rma, (rma_product, rma_qty, rma_uom) in replace_data.items():
+            new_moves = new_moves_dict.get(rma)
+            if new_moves:
+                rma.reception_move_id.move_dest_ids = [(4, m.id) for m in new_moves]
+                bodies[rma.id] = "<br/>".join(
+                    _(
+                        "Replacement: "
+                        'Move <a href="#" data-oe-model="stock.move" '
+                        'data-oe-id="%d">%s</a> (Picking <a href="#" '
+                        'data-oe-model="stock.picking" data-oe-id="%d">%s</a>) '
+                        "has been created."
+                    )
+                    % (
+                        new_move.id,
+                        new_move.name_get()[0][1],
+                        new_move.picking_id.id,
+                        new_move.picking_id.name,
+                    )
+                    for new_move in new_moves
                 )
-            )
-        else:
-            self.message_post(
-                body=_(
+            else:
+                bodies[rma.id] = _(
                     "Replacement:<br/>"
                     'Product <a href="#" data-oe-model="product.product" '
                     'data-oe-id="%d">%s</a><br/>'
                     "Quantity %f %s<br/>"
                     "This replacement did not create a new move, but one of "
                     "the previously created moves was updated with this data."
-                )
-                % (product.id, product.display_name, qty, uom.name)
-            )
-        if self.state != "waiting_replacement":
-            self.state = "waiting_replacement"
+                ) % (rma_product.id, rma_product.display_name, rma_qty, rma_uom.name)
+        rmas._message_log_batch(bodies)
+        rmas.filtered(lambda r: r.state != "waiting_replacement").write(
+            {"state": "waiting_replacement"}
+        )
 
-    def _action_launch_stock_rule(
-        self, scheduled_date, warehouse, product, qty, uom,
-    ):
-        """ Creates a delivery picking and launch stock rule. It is invoked by:
+    def _action_launch_stock_rule(self, scheduled_date, warehouse, replace_data):
+        """ Creates the delivery pickings and launch stock rules. RMAs
+        without a procurement group share a new one per shipping address
+        and company, so their replacements are delivered together, and
+        all the procurements are run at once.
+
+        replace_data is a dict {rma: (product, qty, uom)}.
+
+        It is invoked by:
         rma.create_replace
         """
-        self.ensure_one()
-        if self.product_id.type not in ("consu", "product"):
-            return
-        if not self.procurement_group_id:
-            self.procurement_group_id = (
-                self.env["procurement.group"]
-                .create(
-                    {
-                        "name": self.name,
-                        "move_type": "direct",
-                        "partner_id": self.partner_shipping_id.id,
-                    }
+        rmas = self.filtered(lambda r: r.product_id.type in ("consu", "product"))
+        group_dict = {}
+        for rma in rmas.filtered(lambda r: not r.procurement_group_id):
+            key = (rma.partner_shipping_id.id, rma.company_id.id)
+            group_dict.setdefault(key, self.env["rma"])
+            group_dict[key] |= rma
+        procurement_group = self.env["procurement.group"]
+        for group_rmas in group_dict.values():
+            group = procurement_group.create(
+                group_rmas._prepare_procurement_group_vals()
+            )
+            group_rmas.write({"procurement_group_id": group.id})
+        procurements = []
+        for rma in rmas:
+            product, qty, uom = replace_data[rma]
+            values = rma._prepare_procurement_values(
+                rma.procurement_group_id, scheduled_date, warehouse
+            )
+            procurements.append(
+                procurement_group.Procurement(
+                    product,
+                    qty,
+                    uom,
+                    rma.partner_shipping_id.property_stock_customer,
+                    rma.product_id.display_name,
+                    rma.procurement_group_id.name,
+                    rma.company_id,
+                    values,
                 )
-                .id
             )
-        values = self._prepare_procurement_values(
-            self.procurement_group_id, scheduled_date, warehouse
-        )
-        procurement = self.env["procurement.group"].Procurement(
-            product,
-            qty,
-            uom,
-            self.partner_shipping_id.property_stock_customer,
-            self.product_id.display_name,
-            self.procurement_group_id.name,
-            self.company_id,
-            values,
-        )
-        self.env["procurement.group"].run([procurement])
+        if procurements:
+            procurement_group.run(procurements)
         return True
 
+    def _prepare_procurement_group_vals(self):
+        """ Values of the procurement group shared by the RMAs in self.
+        It is invoked by:
+        rma._action_launch_stock_rule
+        """
+        return {
+            "name": ", ".join(self.mapped("name")),
+            "move_type": "direct",
+            "partner_id": self[:1].partner_shipping_id.id,
+        }
+
     def _prepare_procurement_values(
         self, group_id, scheduled_date, warehouse,
     ):
@@ -1158,35 +1463,84 @@ class Rma(models.Model):
         """Extract the needed values from an incoming rma emails data-set
         to be used to create an RMA.
         """
-        if custom_values is None:
-            custom_values = {}
-        subject = msg_dict.get("subject", "")
-        body = html2plaintext(msg_dict.get("body", ""))
-        desc = _("<b>E-mail subject:</b> %s<br/><br/><b>E-mail body:</b><br/>%s") % (
-            subject,
-            body,
-        )
-        defaults = {
-            "description": desc,
-            "name": _("New"),
-            "origin": _("Incoming e-mail"),
-        }
-        if msg_dict.get("author_id"):
-            partner = self.env["res.partner"].browse(msg_dict.get("author_id"))
-            defaults.update(
-                partner_id=partner.id,
-                partner_invoice_id=partner.address_get(["invoice"]).get(
-                    "invoice", False
-                ),
-            )
-        if msg_dict.get("priority"):
-            defaults["priority"] = msg_dict.get("priority")
-        defaults.update(custom_values)
+        # RMAs created in batch beforehand by [rma.team].message_process_batch
+        batch_rma_ids = self.env.context.get("rma_message_new_batch") or {}
+        if msg_dict.get("message_id") in batch_rma_ids:
+            return self.browse(batch_rma_ids[msg_dict["message_id"]])
+        defaults = self._prepare_message_new_values([msg_dict], custom_values)[0]
         rma = super().message_new(msg_dict, custom_values=defaults)
-        if rma.user_id and rma.user_id.partner_id not in rma.message_partner_ids:
-            rma.message_subscribe([rma.user_id.partner_id.id])
+        rma._subscribe_responsibles()
         return rma
 
+    @api.model
+    def message_new_batch(self, msg_dicts, custom_values=None):
+        """ Create one RMA per incoming email data-set with a single create,
+        with the same values message_new would use.
+
+        invoked by:
+        [rma.team].message_process_batch
+        """
+        rmas = self.create(self._prepare_message_new_values(msg_dicts, custom_values))
+        rmas._subscribe_responsibles()
+        return rmas
+
+    @api.model
+    def _prepare_message_new_values(self, msg_dicts, custom_values=None):
+        """ Values of the RMAs to create from incoming email data-sets.
+        Authors and their invoice addresses are resolved once for all of
+        them.
+
+        invoked by:
+        rma.message_new
+        rma.message_new_batch
+        """
+        authors = self.env["res.partner"].browse(
+            {
+                msg_dict["author_id"]
+                for msg_dict in msg_dicts
+                if msg_dict.get("author_id")
+            }
+        )
+        invoice_addresses = {
+            partner.id: partner.address_get(["invoice"]).get("invoice", False)
+            for partner in authors
+        }
+        vals_list = []
+        for msg_dict in msg_dicts:
+            subject = msg_dict.get("subject", "")
+            body = html2plaintext(msg_dict.get("body", ""))
+            desc = _(
+                "<b>E-mail subject:</b> %s<br/><br/><b>E-mail body:</b><br/>%s"
+            ) % (subject, body)
+            vals = {
+                "description": desc,
+                "name": _("New"),
+                "origin": _("Incoming e-mail"),
+            }
+            if msg_dict.get("author_id"):
+                vals.update(
+                    partner_id=msg_dict["author_id"],
+                    partner_invoice_id=invoice_addresses[msg_dict["author_id"]],
+                )
+            if msg_dict.get("priority"):
+                vals["priority"] = msg_dict.get("priority")
+            vals.update(custom_values or {})
+            vals_list.append(vals)
+        return vals_list
+
+    def _subscribe_responsibles(self):
+        """ Subscribe the responsible users that don't follow their RMAs yet,
+        with one call per user.
+        """
+        user_dict = {}
+        for rma in self.filtered(
+            lambda r: r.user_id and r.user_id.partner_id not in r.message_partner_ids
+        ):
+            user_dict.setdefault(rma.user_id.partner_id, self.env["rma"])
+            user_dict[rma.user_id.partner_id] |= rma
+        for partner, partner_rmas in user_dict.items():
+            partner_rmas.message_subscribe(partner.ids)
+
     @api.returns("mail.message", lambda value: value.id)
     def message_post(self, **kwargs):
         """ Set 'sent' field to True when an email is sent from rma form
@@ -1217,14 +1571,161 @@ class Rma(models.Model):
         return "RMA Report - %s" % self.name
 
     # Other business methods
+    @api.model
+    def _next_sequence_names(self, company_id, count):
+        """ Reserve 'count' consecutive numbers of the RMA sequence of the
+        company in one go, as 'count' calls to next_by_code would do.
+        Standard sequences take the numbers from their PostgreSQL sequence
+        in a single query; 'No gap' sequences lock the row once and move
+        number_next by the whole block, so numbering stays gap-free when
+        the sequence is configured so. Sequences with date ranges are left
+        to the ORM.
+        invoked by: rma.create
+        """
+        ir_sequence = self.env["ir.sequence"].with_context(force_company=company_id)
+        ir_sequence.check_access_rights("read")
+        sequence = ir_sequence.search(
+            [("code", "=", "rma"), ("company_id", "in", [company_id, False])],
+            order="company_id",
+            limit=1,
+        )
+        if not sequence or sequence.use_date_range or count == 1:
+            return [ir_sequence.next_by_code("rma") for __ in range(count)]
+        if sequence.implementation == "standard":
+            self.env.cr.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                ("ir_sequence_%03d" % sequence.id, count),
+            )
+            numbers = sorted(row[0] for row in self.env.cr.fetchall())
+        else:
+            increment = sequence.number_increment
+            sequence.flush(["number_next"])
+            self.env.cr.execute(
+                "SELECT number_next FROM ir_sequence WHERE id = %s FOR UPDATE NOWAIT",
+                (sequence.id,),
+            )
+            self.env.cr.execute(
+                "UPDATE ir_sequence SET number_next = number_next + %s "
+                "WHERE id = %s RETURNING number_next",
+                (increment * count, sequence.id),
+            )
+            first = self.env.cr.fetchone()[0] - increment * count
+            sequence.invalidate_cache(["number_next"], sequence.ids)
+            numbers = [first + i * increment for i in range(count)]
+        return [sequence.get_next_char(number) for number in numbers]
+
+    @api.model
+    def _get_uom_conversion_table(self, uom_ids):
+        """ Read the factor, rounding and category of the given units of
+        measure with a single query.
+
+        :return: dict {uom_id: (factor, rounding, category_id)}
+        """
+        uom_ids = tuple(uom_id for uom_id in uom_ids if uom_id)
+        if not uom_ids:
+            return {}
+        self.env["uom.uom"].flush(["factor", "rounding", "category_id"])
+        self.env.cr.execute(
+            "SELECT id, factor, rounding, category_id FROM uom_uom WHERE id IN %s",
+            (uom_ids,),
+        )
+        return {row[0]: row[1:] for row in self.env.cr.fetchall()}
+
+    @api.model
+    def _convert_uom_quantities(self, quantities, table=None):
+        """ Batch version of [uom.uom]._compute_quantity. The units of
+        measure involved are read once (or taken from 'table', as returned
+        by _get_uom_conversion_table) instead of being resolved through the
+        ORM for each quantity.
+
+        :param quantities: list of tuples (qty, from_uom_id, to_uom_id)
+                           optionally followed by 'round' and
+                           'rounding_method' as in _compute_quantity.
+        :return: list with the converted quantities, in the same order.
+        """
+        if table is None:
+            table = self._get_uom_conversion_table(
+                {uom_id for item in quantities for uom_id in item[1:3]}
+            )
+        result = []
+        for item in quantities:
+            qty, from_uom_id, to_uom_id = item[:3]
+            rounding_method = item[4] if len(item) > 4 else "UP"
+            if not qty or not from_uom_id:
+                result.append(qty)
+                continue
+            from_uom = table.get(from_uom_id)
+            to_uom = table.get(to_uom_id)
+            if not from_uom or not to_uom or from_uom[2] != to_uom[2]:
+                # Let the ORM deal with missing units and raise the
+                # category mismatch error
+                uom_obj = self.env["uom.uom"]
+                result.append(
+                    uom_obj.browse(from_uom_id)._compute_quantity(
+                        qty,
+                        uom_obj.browse(to_uom_id),
+                        round=item[3] if len(item) > 3 else True,
+                        rounding_method=rounding_method,
+                    )
+                )
+                continue
+            amount = qty / from_uom[0] * to_uom[0]
+            if len(item) < 4 or item[3]:
+                amount = float_round(
+                    amount,
+                    precision_rounding=to_uom[1],
+                    rounding_method=rounding_method,
+                )
+            result.append(amount)
+        return result
+
+    def _update_delivery_states(self, targets):
+        """ Set the RMAs in self to the 'received', 'replaced' or 'returned'
+        state when their delivery moves allow it. The stored delivered
+        quantities of all the RMAs are recomputed at once when read and at
+        most one write is done per target state.
+
+        :param targets: iterable of target states to check, in the same
+                        order the former update_*_state methods were run.
+        """
+        query_count = getattr(self.env.cr, "sql_log_count", 0)
+        to_write = {}
+        for rma in self:
+            remaining_qty = rma.remaining_qty
+            remaining_qty_to_done = rma.remaining_qty_to_done
+            state = rma.state
+            for target in targets:
+                if target == "received" and rma.delivered_qty == 0:
+                    state = "received"
+                elif (
+                    target == "replaced"
+                    and state == "waiting_replacement"
+                    and 0 >= remaining_qty_to_done == remaining_qty
+                ):
+                    state = "replaced"
+                elif (
+                    target == "returned"
+                    and state == "waiting_return"
+                    and remaining_qty_to_done <= 0
+                ):
+                    state = "returned"
+            if state != rma.state:
+                to_write.setdefault(state, self.env["rma"])
+                to_write[state] |= rma
+        for state, rmas in to_write.items():
+            rmas.write({"state": state})
+        _logger.debug(
+            "RMA delivery state update of %d RMAs took %d queries",
+            len(self),
+            getattr(self.env.cr, "sql_log_count", 0) - query_count,
+        )
+
     def update_received_state(self):
         """ Invoked by:
          [stock.move].unlink
          [stock.move]._action_cancel
          """
-        rma = self.filtered(lambda r: r.delivered_qty == 0)
-        if rma:
-            rma.write({"state": "received"})
+        self._update_delivery_states(["received"])
 
     def update_replaced_state(self):
         """ Invoked by:
@@ -1232,19 +1733,8 @@ class Rma(models.Model):
          [stock.move].unlink
          [stock.move]._action_cancel
          """
-        rma = self.filtered(
-            lambda r: (
-                r.state == "waiting_replacement"
-                and 0 >= r.remaining_qty_to_done == r.remaining_qty
-            )
-        )
-        if rma:
-            rma.write({"state": "replaced"})
+        self._update_delivery_states(["replaced"])
 
     def update_returned_state(self):
         """ Invoked by [stock.move]._action_done"""
-        rma = self.filtered(
-            lambda r: (r.state == "waiting_return" and r.remaining_qty_to_done <= 0)
-        )
-        if rma:
-            rma.write({"state": "returned"})
+        self._update_delivery_states(["returned"])
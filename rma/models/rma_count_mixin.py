@@ -0,0 +1,74 @@
+# Copyright 2026 Tecnativa
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import fields, models
+
+
+class RmaCountMixin(models.AbstractModel):
+    """ Smart button counter of the RMAs linked to a record. The RMAs of
+    all the records in a batch are counted with a single grouped read.
+    """
+
+    _name = "rma.count.mixin"
+    _description = "RMA count mixin"
+
+    # Path of the RMA fields that links an RMA to the records of the
+    # inheriting model. All the fields of the path must be many2one fields,
+    # e.g. 'move_id.picking_id'.
+    _rma_count_field = "partner_id"
+
+    rma_count = fields.Integer(string="RMA count", compute="_compute_rma_count")
+
+    def _get_rma_domain(self):
+        return [(self._rma_count_field, "in", self.ids)]
+
+    def _get_rma_counts(self, count_field=None):
+        """ Count the RMAs of the records in self with one grouped read.
+        When the path of _rma_count_field has several fields, the RMAs are
+        grouped by its first field and the groups are added up following
+        the rest of the path.
+
+        :param count_field: path to use instead of _rma_count_field
+        :return: dict {record id: number of RMAs}
+        """
+        if not self.ids:
+            return {}
+        rma_model = self.env["rma"]
+        path = count_field or self._rma_count_field
+        group_field, __, related_path = path.partition(".")
+        rma_data = rma_model.read_group(
+            [(path, "in", self.ids)], [group_field], [group_field]
+        )
+        counts = {
+            r[group_field][0]: r[group_field + "_count"]
+            for r in rma_data
+            if r[group_field]
+        }
+        if not related_path:
+            return counts
+        comodel = self.env[rma_model._fields[group_field].comodel_name]
+        related_counts = {}
+        for record in comodel.sudo().browse(counts):
+            record_id = record.mapped(related_path).id
+            related_counts[record_id] = (
+                related_counts.get(record_id, 0) + counts[record.id]
+            )
+        return related_counts
+
+    def _compute_rma_count(self):
+        counts = self._get_rma_counts()
+        for record in self:
+            record.rma_count = counts.get(record.id, 0)
+
+    def action_view_rma(self):
+        self.ensure_one()
+        action = self.env.ref("rma.rma_action").read()[0]
+        domain = self._get_rma_domain()
+        if self.rma_count == 1:
+            rma = self.env["rma"].search(domain, limit=1)
+            action.update(
+                res_id=rma.id, view_mode="form", view_id=False, views=False,
+            )
+        else:
+            action["domain"] = domain
+        return action
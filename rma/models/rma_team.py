@@ -1,7 +1,14 @@
 # Copyright 2020 Tecnativa - Ernesto Tejeda
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from odoo import _, fields, models
+import email
+import email.policy
+import logging
+import time
+
+from odoo import _, fields, models, tools
+
+_logger = logging.getLogger(__name__)
 
 
 class RmaTeam(models.Model):
@@ -39,11 +46,7 @@ class RmaTeam(models.Model):
         if not default.get("name"):
             default["name"] = _("%s (copy)") % self.name
         team = super().copy(default)
-        for follower in self.message_follower_ids:
-            team.message_subscribe(
-                partner_ids=follower.partner_id.ids,
-                subtype_ids=follower.subtype_ids.ids,
-            )
+        self._message_copy_followers(team)
         return team
 
     def get_alias_model_name(self, vals):
@@ -53,3 +56,146 @@ class RmaTeam(models.Model):
         values = super().get_alias_values()
         values["alias_defaults"] = {"team_id": self.id}
         return values
+
+    def message_process_batch(
+        self, messages, model=None, save_original=False, strip_attachments=False
+    ):
+        """ Process a batch of raw incoming emails, as message_process would
+        do one by one (e.g. to drain a backlog of emails sent to the aliases
+        of these teams). Every email goes through message_route, so the
+        alias contact policy, bounces and the rest of the routing rules
+        apply. Already processed emails are skipped.
+
+        The emails are processed in waves: the replies to other emails of
+        the batch wait until the emails they answer are stored, so they are
+        routed to the thread of those emails instead of opening new RMAs.
+
+        :param messages: list of raw emails (str or bytes)
+        :param model, save_original, strip_attachments: as in message_process
+        :return: the created RMAs
+        """
+        start = time.time()
+        pending = []
+        processed = set()
+        for message in messages:
+            if isinstance(message, str):
+                message = message.encode("utf-8")
+            message = email.message_from_bytes(message, policy=email.policy.SMTP)
+            msg_dict = self._message_parse_batch(
+                message, save_original, strip_attachments
+            )
+            if msg_dict["message_id"] in processed:
+                self._message_log_duplicated(msg_dict)
+                continue
+            processed.add(msg_dict["message_id"])
+            pending.append((message, msg_dict))
+        existing = set(
+            self.env["mail.message"]
+            .search([("message_id", "in", list(processed))])
+            .mapped("message_id")
+        )
+        for __, msg_dict in pending:
+            if msg_dict["message_id"] in existing:
+                self._message_log_duplicated(msg_dict)
+        pending = [item for item in pending if item[1]["message_id"] not in existing]
+        waiting = {msg_dict["message_id"] for __, msg_dict in pending}
+        rmas = self.env["rma"]
+        while pending:
+            wave, replies = [], []
+            for message, msg_dict in pending:
+                references = set(
+                    tools.mail_header_msgid_re.findall(
+                        "%s %s"
+                        % (
+                            message.get("In-Reply-To") or "",
+                            message.get("References") or "",
+                        )
+                    )
+                )
+                references.discard(msg_dict["message_id"])
+                if references & waiting:
+                    replies.append(message)
+                else:
+                    wave.append((message, msg_dict))
+            if not wave:
+                # Circular references, nothing left to wait for
+                wave = [(message, msg_dict) for message, msg_dict in pending]
+                replies = []
+            rmas |= self._message_process_wave(wave, model)
+            waiting -= {msg_dict["message_id"] for __, msg_dict in wave}
+            # The replies are parsed again now that the emails they answer
+            # are stored, so they get their parent message
+            pending = [
+                (
+                    message,
+                    self._message_parse_batch(
+                        message, save_original, strip_attachments
+                    ),
+                )
+                for message in replies
+            ]
+        _logger.info(
+            "%d RMAs created from %d incoming emails in %.2fs",
+            len(rmas),
+            len(messages),
+            time.time() - start,
+        )
+        return rmas.with_env(self.env)
+
+    def _message_parse_batch(self, message, save_original, strip_attachments):
+        msg_dict = self.env["mail.thread"].message_parse(
+            message, save_original=save_original
+        )
+        if strip_attachments:
+            msg_dict.pop("attachments", None)
+        return msg_dict
+
+    def _message_log_duplicated(self, msg_dict):
+        _logger.info(
+            "Ignored mail from %s to %s with Message-Id %s: found "
+            "duplicated Message-Id during processing",
+            msg_dict.get("email_from"),
+            msg_dict.get("to"),
+            msg_dict["message_id"],
+        )
+
+    def _message_process_wave(self, msg_list, model=None):
+        """ Route the given emails, create at once the RMAs of the ones
+        routed to the aliases of these teams and process all of them
+        through _message_route_process, which gets the RMA created for
+        each email.
+
+        invoked by:
+        rma.team.message_process_batch
+        """
+        thread_obj = self.env["mail.thread"]
+        aliases = self.mapped("alias_id")
+        routed_list = []
+        batch_dict = {}
+        for message, msg_dict in msg_list:
+            routes = thread_obj.message_route(message, msg_dict, model)
+            routed_list.append((message, msg_dict, routes))
+            # Only the emails creating an RMA of these teams are batched
+            if len(routes) == 1:
+                route_model, thread_id, custom_values, user_id, alias = routes[0]
+                if route_model == "rma" and not thread_id and alias in aliases:
+                    batch_dict.setdefault((alias, user_id), (custom_values, []))
+                    batch_dict[(alias, user_id)][1].append(msg_dict)
+        rmas = self.env["rma"]
+        batch_rma_ids = {}
+        for (__, user_id), (custom_values, msg_dicts) in batch_dict.items():
+            # Same context and user as _message_route_process
+            rma_obj = (
+                self.env["rma"]
+                .with_context(mail_create_nosubscribe=True, mail_create_nolog=True)
+                .with_user(user_id)
+                .sudo()
+            )
+            user_rmas = rma_obj.message_new_batch(msg_dicts, custom_values)
+            for msg_dict, rma in zip(msg_dicts, user_rmas):
+                batch_rma_ids[msg_dict["message_id"]] = rma.id
+            rmas |= user_rmas
+        thread_obj = thread_obj.with_context(rma_message_new_batch=batch_rma_ids)
+        for message, msg_dict, routes in routed_list:
+            thread_obj._message_route_process(message, msg_dict, routes)
+        return rmas
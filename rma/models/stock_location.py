@@ -0,0 +1,37 @@
+# Copyright 2026 Tecnativa
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import models
+
+
+class StockLocation(models.Model):
+    _inherit = "stock.location"
+
+    def _is_in_rma_location_tree(self):
+        """ Whether any location in self is an RMA location of a warehouse,
+        is placed under one or has one under it, using the cached paths of
+        the RMA locations.
+        """
+        rma_paths = [
+            parent_path
+            for __, __, __, parent_path in self.env[
+                "stock.warehouse"
+            ]._get_rma_location_data()
+            if parent_path
+        ]
+        for path in self.mapped("parent_path"):
+            if path and any(
+                path.startswith(rma_path) or rma_path.startswith(path)
+                for rma_path in rma_paths
+            ):
+                return True
+        return False
+
+    def write(self, vals):
+        # The paths must be checked before the location tree changes
+        clear_cache = "location_id" in vals and self._is_in_rma_location_tree()
+        res = super().write(vals)
+        if clear_cache:
+            # The RMA locations of the warehouses may be resolved differently
+            self.env["stock.warehouse"].clear_caches()
+        return res
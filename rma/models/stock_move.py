@@ -1,9 +1,13 @@
 # Copyright 2020 Tecnativa - Ernesto Tejeda
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+import logging
+
 from odoo import _, api, fields, models
 from odoo.exceptions import ValidationError
 
+_logger = logging.getLogger(__name__)
+
 
 class StockMove(models.Model):
     _inherit = "stock.move"
@@ -21,6 +25,18 @@ class StockMove(models.Model):
     )
     # RMA that create the delivery movement to the customer
     rma_id = fields.Many2one(comodel_name="rma", string="RMA return", copy=False,)
+    # Single RMA receiver, used as a merge key of the reception moves
+    rma_receiver_id = fields.Many2one(
+        comodel_name="rma",
+        string="RMA receiver",
+        compute="_compute_rma_receiver_id",
+        compute_sudo=True,
+    )
+
+    @api.depends("rma_receiver_ids")
+    def _compute_rma_receiver_id(self):
+        for move in self:
+            move.rma_receiver_id = move.rma_receiver_ids[:1]
 
     def unlink(self):
         # A stock user could have no RMA permissions, so the ids wouldn't
@@ -29,8 +45,7 @@ class StockMove(models.Model):
         rma = self.sudo().mapped("rma_id")
         res = super().unlink()
         rma_receiver.write({"state": "draft"})
-        rma.update_received_state()
-        rma.update_replaced_state()
+        rma._update_delivery_states(["received", "replaced"])
         return res
 
     def _action_cancel(self):
@@ -39,8 +54,9 @@ class StockMove(models.Model):
         # be accessible due to record rules.
         cancelled_moves = self.filtered(lambda r: r.state == "cancel").sudo()
         cancelled_moves.mapped("rma_receiver_ids").write({"state": "draft"})
-        cancelled_moves.mapped("rma_id").update_received_state()
-        cancelled_moves.mapped("rma_id").update_replaced_state()
+        cancelled_moves.mapped("rma_id")._update_delivery_states(
+            ["received", "replaced"]
+        )
         return res
 
     def _action_done(self, cancel_backorder=False):
@@ -48,6 +64,7 @@ class StockMove(models.Model):
         quantity in the linked receiver RMA. It also set the appropriated
         linked RMA to 'received' or 'delivered'.
         """
+        query_count = getattr(self.env.cr, "sql_log_count", 0)
         for move in self.filtered(lambda r: r.state not in ("done", "cancel")):
             rma_receiver = move.sudo().rma_receiver_ids
             if rma_receiver and move.quantity_done != rma_receiver.product_uom_qty:
@@ -70,16 +87,34 @@ class StockMove(models.Model):
         )
         to_be_received.write({"state": "received"})
         # Set RMAs as delivered
-        move_done.mapped("rma_id").update_replaced_state()
-        move_done.mapped("rma_id").update_returned_state()
+        move_done.mapped("rma_id")._update_delivery_states(["replaced", "returned"])
+        _logger.debug(
+            "Validation of %d stock moves took %d queries",
+            len(self),
+            getattr(self.env.cr, "sql_log_count", 0) - query_count,
+        )
         return res
 
     @api.model
     def _prepare_merge_moves_distinct_fields(self):
         """ The main use is that launched delivery RMAs doesn't merge
-        two moves if they are linked to a different RMAs.
+        two moves if they are linked to a different RMAs. The same applies
+        to reception moves of RMAs confirmed together in the same picking.
+        """
+        return super()._prepare_merge_moves_distinct_fields() + [
+            "rma_id",
+            "rma_receiver_id",
+        ]
+
+    @api.model
+    def _prepare_merge_move_sort_method(self, move):
+        """ Moves are grouped by the distinct fields after being sorted with
+        this key, so the RMA fields must be part of it too.
         """
-        return super()._prepare_merge_moves_distinct_fields() + ["rma_id"]
+        return super()._prepare_merge_move_sort_method(move) + [
+            move.rma_id.id,
+            move.rma_receiver_id.id,
+        ]
 
     def _prepare_move_split_vals(self, qty):
         """ Intended to the backport of picking linked to RMAs propagates the
@@ -1,37 +1,90 @@
 # Copyright 2020 Tecnativa - Ernesto Tejeda
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from odoo import fields, models
+import base64
 
+from odoo import fields, models
 
-class StockPicking(models.Model):
-    _inherit = "stock.picking"
+# res_field of the attachments caching the delivery slip shown in the
+# portal. Attachments with a res_field are hidden from the chatter and
+# from the attachment lists, so they can't be mistaken for user files.
+RMA_REPORT_FIELD = "rma_portal_report"
 
-    rma_count = fields.Integer(string="RMA count", compute="_compute_rma_count",)
 
-    def _compute_rma_count(self):
-        for rec in self:
-            rec.rma_count = len(rec.move_lines.mapped("rma_ids"))
+class StockPicking(models.Model):
+    _name = "stock.picking"
+    _inherit = ["stock.picking", "rma.count.mixin"]
+    _rma_count_field = "move_id.picking_id"
 
     def copy(self, default=None):
         self.ensure_one()
         if self.env.context.get("set_rma_picking_type"):
-            location_dest_id = default["location_dest_id"]
-            warehouse = self.env["stock.warehouse"].search(
-                [("rma_loc_id", "parent_of", location_dest_id)], limit=1
+            location_dest = self.env["stock.location"].browse(
+                default["location_dest_id"]
             )
+            warehouse = self.env["stock.warehouse"]._get_warehouses_by_rma_location(
+                location_dest
+            )[location_dest.id]
             if warehouse:
                 default["picking_type_id"] = warehouse.rma_in_type_id.id
         return super().copy(default)
 
-    def action_view_rma(self):
+    def _get_rma_report_version(self):
+        """ Last change of the picking or its moves, as a string. Used to
+        know if the cached delivery slip is outdated.
+        """
         self.ensure_one()
-        action = self.env.ref("rma.rma_action").read()[0]
-        rma = self.move_lines.mapped("rma_ids")
-        if len(rma) == 1:
-            action.update(
-                res_id=rma.id, view_mode="form", view_id=False, views=False,
+        return fields.Datetime.to_string(
+            max(
+                [self.write_date]
+                + self.move_lines.mapped("write_date")
+                + self.move_line_ids.mapped("write_date")
             )
+        )
+
+    def _get_rma_report_attachment(self):
+        """ Delivery slip PDF of the picking shown in the RMA portal. It is
+        cached in an attachment of the picking, marked with a dedicated
+        res_field, whose description is the picking version it was
+        rendered from. It is rendered again when the picking changed since
+        then. Only these cache attachments are ever replaced or deleted.
+
+        invoked by:
+        rma portal controller (portal_my_rma_picking_report)
+        """
+        self.ensure_one()
+        version = self._get_rma_report_version()
+        attachments = (
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", self._name),
+                    ("res_id", "=", self.id),
+                    ("res_field", "=", RMA_REPORT_FIELD),
+                ],
+                order="id",
+            )
+        )
+        attachment = attachments.filtered(lambda a: a.description == version)[:1]
+        if attachment:
+            (attachments - attachment).unlink()
+            return attachment
+        report = self.env.ref("stock.action_report_delivery").sudo()
+        vals = {
+            "name": "%s.pdf" % self.name.replace("/", "_"),
+            "type": "binary",
+            "datas": base64.b64encode(report.render_qweb_pdf(self.ids)[0]),
+            "mimetype": "application/pdf",
+            "description": version,
+        }
+        if attachments:
+            attachment = attachments[0]
+            attachment.write(vals)
+            (attachments - attachment).unlink()
         else:
-            action["domain"] = [("id", "in", rma.ids)]
-        return action
+            vals.update(
+                res_model=self._name, res_id=self.id, res_field=RMA_REPORT_FIELD
+            )
+            attachment = self.env["ir.attachment"].sudo().create(vals)
+        return attachment
@@ -1,7 +1,7 @@
 # Copyright 2020 Tecnativa - Ernesto Tejeda
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from odoo import _, api, fields, models
+from odoo import _, api, fields, models, tools
 
 
 class StockWarehouse(models.Model):
@@ -36,8 +36,85 @@ class StockWarehouse(models.Model):
         for record in res:
             rma_location_vals = record._get_rma_location_values()
             record.rma_loc_id = stock_location.create(rma_location_vals).id
+        self.clear_caches()
         return res
 
+    def write(self, vals):
+        res = super().write(vals)
+        if set(vals) & {"rma_loc_id", "active", "company_id", "sequence"}:
+            self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.clear_caches()
+        return res
+
+    @api.model
+    @tools.ormcache()
+    def _get_rma_location_data(self):
+        """ Active warehouses in their default order, as tuples
+        (warehouse id, company id, RMA location id, RMA location
+        parent_path). Cached per registry and invalidated when a
+        warehouse or the location tree changes.
+        """
+        warehouses = self.sudo().with_context({}).search([])
+        return tuple(
+            (wh.id, wh.company_id.id, wh.rma_loc_id.id, wh.rma_loc_id.parent_path)
+            for wh in warehouses
+        )
+
+    @api.model
+    def _get_warehouses_by_rma_location(self, locations):
+        """ Resolve in one pass the warehouse whose RMA location is the
+        given location or one of its parents, as a search with
+        [('rma_loc_id', 'parent_of', location.id)] and limit=1 would do.
+
+        :return: dict {location_id: stock.warehouse recordset}
+        """
+        company_ids = set(self.env.companies.ids)
+        data = [
+            (wh_id, parent_path)
+            for wh_id, company_id, __, parent_path in self._get_rma_location_data()
+            if parent_path and (self.env.su or company_id in company_ids)
+        ]
+        result = {}
+        for location in locations:
+            path = location.parent_path or ""
+            warehouse_id = next(
+                (wh_id for wh_id, parent_path in data if path.startswith(parent_path)),
+                False,
+            )
+            result[location.id] = self.browse(warehouse_id)
+        return result
+
+    @api.model
+    def _get_rma_root_location_ids(self):
+        """ RMA locations of the warehouses available to the user, taken
+        from the cached warehouse data. Used by the location domains of the
+        RMA forms and wizards.
+        """
+        company_ids = set(self.env.companies.ids)
+        return [
+            rma_loc_id
+            for __, company_id, rma_loc_id, ___ in self._get_rma_location_data()
+            if rma_loc_id
+            and (self.env.su or not company_id or company_id in company_ids)
+        ]
+
+    @api.model
+    def _get_company_warehouse(self, company):
+        """ Cached equivalent of searching the first warehouse of a company."""
+        warehouse_id = next(
+            (
+                wh_id
+                for wh_id, company_id, __, ___ in self._get_rma_location_data()
+                if company_id == company.id
+            ),
+            False,
+        )
+        return self.browse(warehouse_id)
+
     def _get_rma_location_values(self):
         """ this method is intended to be used by 'create' method
         to create a new RMA location to be linked to a new warehouse.
@@ -1,6 +1,13 @@
 # Copyright 2020 Tecnativa - Ernesto Tejeda
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+import base64
+import mailbox
+import os
+import tempfile
+from email.message import EmailMessage
+from unittest.mock import patch
+
 from odoo.exceptions import UserError, ValidationError
 from odoo.tests import Form, SavepointCase
 
@@ -220,6 +227,51 @@ class TestRma(SavepointCase):
         self.assertEqual(rma.state, "received")
         self._test_readonly_fields(rma)
 
+    def test_mass_confirm(self):
+        # rma_1 and rma_2: Same shipping address, different products
+        rma_1 = self._create_rma(self.partner, self.product, 10, self.rma_loc)
+        product_2 = self.product_product.create(
+            {"name": "Product 2 test", "type": "product"}
+        )
+        rma_2 = self._create_rma(self.partner, product_2, 5, self.rma_loc)
+        # rma_3: Same shipping address and same product as rma_1
+        rma_3 = self._create_rma(self.partner, self.product, 3, self.rma_loc)
+        # rma_4: Different partner
+        partner = self.res_partner.create({"name": "Partner 2 test"})
+        rma_4 = self._create_rma(partner, self.product, 7, self.rma_loc)
+        all_rmas = rma_1 | rma_2 | rma_3 | rma_4
+        action = self.env.ref("rma.rma_confirm_action_server")
+        ctx = dict(self.env.context)
+        ctx.update(active_ids=all_rmas.ids, active_model="rma")
+        action.with_context(ctx).run()
+        self.assertEqual(all_rmas.mapped("state"), ["confirmed"] * 4)
+        # One reception per shipping address
+        pick_1 = (rma_1 | rma_2 | rma_3).mapped("reception_move_id.picking_id")
+        pick_2 = rma_4.reception_move_id.picking_id
+        self.assertEqual(len(pick_1), 1)
+        self.assertEqual(len(pick_2), 1)
+        self.assertNotEqual(pick_1, pick_2)
+        self.assertEqual((pick_1 | pick_2).mapped("state"), ["assigned"] * 2)
+        self.assertEqual(pick_1.partner_id, self.partner_shipping)
+        self.assertEqual(pick_1.picking_type_id, self.warehouse_company.rma_in_type_id)
+        # Each RMA has its own reception move, even with the same product
+        self.assertEqual(len(pick_1.move_lines), 3)
+        self.assertEqual(
+            pick_1.move_lines, (rma_1 | rma_2 | rma_3).mapped("reception_move_id")
+        )
+        for rma in all_rmas:
+            self.assertEqual(rma.reception_move_id.product_id, rma.product_id)
+            self.assertEqual(rma.reception_move_id.product_uom_qty, rma.product_uom_qty)
+            self.assertEqual(rma.reception_move_id.product_uom, rma.product_uom)
+            self.assertEqual(rma.reception_move_id.location_dest_id, self.rma_loc)
+            self.assertIn(rma.partner_id, rma.message_partner_ids)
+        # Receiving the picking set all of its RMAs as received
+        for move in pick_1.move_lines:
+            move.quantity_done = move.product_uom_qty
+        pick_1.action_done()
+        self.assertEqual((rma_1 | rma_2 | rma_3).mapped("state"), ["received"] * 3)
+        self.assertEqual(rma_4.state, "confirmed")
+
     def test_cancel(self):
         # cancel a draft RMA
         rma = self._create_rma(self.partner, self.product)
@@ -265,6 +317,12 @@ class TestRma(SavepointCase):
         self.assertEqual(rma.refund_line_id.product_id, rma.product_id)
         self.assertEqual(rma.refund_line_id.quantity, 10)
         self.assertEqual(rma.refund_line_id.product_uom_id, rma.product_uom)
+        self.assertEqual(rma.refund_line_id.rma_id, rma)
+        self.assertEqual(
+            rma.refund_line_id.tax_ids,
+            rma.product_id.taxes_id.filtered(lambda r: r.company_id == self.company),
+        )
+        self.assertEqual(rma.refund_id.invoice_origin, rma.name)
         self.assertEqual(rma.state, "refunded")
         self.assertFalse(rma.can_be_refunded)
         self.assertFalse(rma.can_be_returned)
@@ -283,6 +341,21 @@ class TestRma(SavepointCase):
         self.assertFalse(rma.can_be_replaced)
         self._test_readonly_fields(rma)
 
+    def test_action_refund_default_tax(self):
+        sale_tax = self.company.account_sale_tax_id
+        if not sale_tax:
+            sale_tax = self.env["account.tax"].create(
+                {"name": "RMA sale tax", "amount": 10, "type_tax_use": "sale"}
+            )
+            self.company.account_sale_tax_id = sale_tax
+        product = self.product_product.create(
+            {"name": "Untaxed product", "type": "product", "taxes_id": [(5, 0)]}
+        )
+        rma = self._create_confirm_receive(self.partner, product, 2, self.rma_loc)
+        rma.action_refund()
+        self.assertEqual(rma.refund_line_id.rma_id, rma)
+        self.assertEqual(rma.refund_line_id.tax_ids, sale_tax)
+
     def test_mass_refund(self):
         # Create, confirm and receive rma_1
         rma_1 = self._create_confirm_receive(
@@ -433,6 +506,48 @@ class TestRma(SavepointCase):
         self.assertTrue(rma.can_be_replaced)
         self._test_readonly_fields(rma)
 
+    def test_mass_replace(self):
+        rma_1 = self._create_confirm_receive(
+            self.partner, self.product, 10, self.rma_loc
+        )
+        product_2 = self.product_product.create(
+            {"name": "Product 2 test", "type": "product"}
+        )
+        rma_2 = self._create_confirm_receive(self.partner, product_2, 5, self.rma_loc)
+        partner = self.res_partner.create({"name": "Partner 2 test"})
+        rma_3 = self._create_confirm_receive(partner, self.product, 3, self.rma_loc)
+        all_rmas = rma_1 | rma_2 | rma_3
+        delivery_wizard = (
+            self.env["rma.delivery.wizard"]
+            .with_context(active_ids=all_rmas.ids, rma_delivery_type="replace")
+            .create({})
+        )
+        delivery_wizard.action_deliver()
+        self.assertEqual(all_rmas.mapped("state"), ["waiting_replacement"] * 3)
+        # The RMAs of the same shipping address share the procurement group
+        self.assertEqual(rma_1.procurement_group_id, rma_2.procurement_group_id)
+        self.assertNotEqual(rma_1.procurement_group_id, rma_3.procurement_group_id)
+        pick_1 = (rma_1 | rma_2).mapped("delivery_move_ids.picking_id")
+        pick_2 = rma_3.delivery_move_ids.picking_id
+        self.assertEqual(len(pick_1), 1)
+        self.assertEqual(len(pick_2), 1)
+        self.assertNotEqual(pick_1, pick_2)
+        # Each RMA is replaced with its own product and quantity
+        for rma in all_rmas:
+            self.assertEqual(len(rma.delivery_move_ids), 1)
+            self.assertEqual(rma.delivery_move_ids.product_id, rma.product_id)
+            self.assertEqual(rma.delivery_move_ids.product_uom_qty, rma.product_uom_qty)
+            self.assertEqual(rma.remaining_qty, 0)
+            self.assertIn(rma.delivery_move_ids, rma.reception_move_id.move_dest_ids)
+        # Validate the picking of the first customer
+        for move in pick_1.move_lines:
+            move.quantity_done = move.product_uom_qty
+        pick_1.action_done()
+        quantities = [(r.delivered_qty, r.delivered_qty_done) for r in all_rmas]
+        self.assertEqual(quantities, [(10, 10), (5, 5), (3, 0)])
+        self.assertEqual((rma_1 | rma_2).mapped("state"), ["replaced"] * 2)
+        self.assertEqual(rma_3.state, "waiting_replacement")
+
     def test_return_to_customer(self):
         # Create, confirm and receive an RMA
         rma = self._create_confirm_receive(self.partner, self.product, 10, self.rma_loc)
@@ -483,6 +598,13 @@ class TestRma(SavepointCase):
         self.assertEqual(rma.delivered_qty_done, 2)
         self.assertEqual(rma.remaining_qty_to_done, 8)
         self.assertEqual(rma.state, "waiting_return")
+        # Stored quantities are kept current and can be searched
+        self.assertEqual(
+            self.env["rma"].search(
+                [("id", "=", rma.id), ("remaining_qty_to_done", "=", 8)]
+            ),
+            rma,
+        )
         # remaining_qty is 0 but rma is not set to 'returned' until
         # remaining_qty_to_done is less than or equal to 0
         picking_2 = second_move.picking_id
@@ -564,6 +686,44 @@ class TestRma(SavepointCase):
         pick_2.button_validate()
         self.assertEqual(all_rmas.mapped("state"), ["returned"] * 4)
 
+    def test_mass_return_to_customer_high_volume(self):
+        """Benchmark: 500 RMAs returned to the same customer end up in a
+        single picking with one move per RMA."""
+        vals = {
+            "partner_id": self.partner.id,
+            "partner_invoice_id": self.partner_invoice.id,
+            "partner_shipping_id": self.partner_shipping.id,
+            "product_id": self.product.id,
+            "product_uom_qty": 1,
+            "product_uom": self.product.uom_id.id,
+            "location_id": self.rma_loc.id,
+        }
+        rmas = self.env["rma"].create([dict(vals) for _i in range(500)])
+        rmas.action_confirm()
+        reception = rmas.mapped("reception_move_id.picking_id")
+        self.assertEqual(len(reception), 1)
+        for move in reception.move_lines:
+            move.quantity_done = move.product_uom_qty
+        reception.action_done()
+        self.assertEqual(set(rmas.mapped("state")), {"received"})
+        delivery_wizard = (
+            self.env["rma.delivery.wizard"]
+            .with_context(active_ids=rmas.ids, rma_delivery_type="return")
+            .create({})
+        )
+        delivery_wizard.action_deliver()
+        picking = rmas.mapped("delivery_move_ids.picking_id")
+        self.assertEqual(len(picking), 1)
+        self.assertEqual(picking.partner_id, self.partner_shipping)
+        self.assertEqual(len(picking.move_lines), 500)
+        self.assertEqual(picking.move_lines.mapped("rma_id"), rmas)
+        self.assertEqual(set(rmas.mapped("state")), {"waiting_return"})
+        # One message announces all the RMAs in the picking
+        origin_messages = picking.message_ids.filtered(
+            lambda r: rmas[0].name in (r.body or "")
+        )
+        self.assertEqual(len(origin_messages), 1)
+
     def test_rma_from_picking_return(self):
         # Create a return from a delivery picking
         origin_delivery = self._create_delivery()
@@ -592,6 +752,159 @@ class TestRma(SavepointCase):
         reception.button_validate()
         self.assertEqual(rmas.mapped("state"), ["received"] * 2)
 
+    def test_mass_confirm_from_picking(self):
+        origin_delivery = self._create_delivery()
+        move_1 = origin_delivery.move_lines.filtered(
+            lambda r: r.product_id == self.product
+        )
+        move_2 = origin_delivery.move_lines - move_1
+        rmas = self.env["rma"].create(
+            [
+                {
+                    "partner_id": self.partner.id,
+                    "picking_id": origin_delivery.id,
+                    "move_id": move.id,
+                    "product_id": move.product_id.id,
+                    "product_uom_qty": qty,
+                    "product_uom": move.product_uom.id,
+                    "location_id": self.rma_loc.id,
+                }
+                for move, qty in [(move_1, 4), (move_1, 6), (move_2, 20)]
+            ]
+        )
+        rmas.action_confirm()
+        self.assertEqual(rmas.mapped("state"), ["confirmed"] * 3)
+        # The RMAs of the same delivery move can't share a return picking
+        receptions = rmas.mapped("reception_move_id.picking_id")
+        self.assertEqual(len(receptions), 2)
+        self.assertEqual(
+            rmas[0].reception_move_id.picking_id, rmas[2].reception_move_id.picking_id
+        )
+        for rma in rmas:
+            self.assertEqual(rma.reception_move_id.origin_returned_move_id, rma.move_id)
+            self.assertEqual(rma.reception_move_id.product_uom_qty, rma.product_uom_qty)
+            self.assertIn(rma.name, rma.reception_move_id.picking_id.origin)
+
+    def _count_rma_count_queries(self, records):
+        records.invalidate_cache(["rma_count"])
+        query_count = self.env.cr.sql_log_count
+        records.mapped("rma_count")
+        return self.env.cr.sql_log_count - query_count
+
+    def test_rma_count(self):
+        deliveries = self.env["stock.picking"]
+        for _i in range(3):
+            deliveries |= self._create_delivery()
+        rmas = self.env["rma"].create(
+            [
+                {
+                    "partner_id": self.partner.id,
+                    "picking_id": delivery.id,
+                    "move_id": move.id,
+                    "product_id": move.product_id.id,
+                    "product_uom_qty": 1,
+                    "product_uom": move.product_uom.id,
+                    "location_id": self.rma_loc.id,
+                }
+                for delivery in deliveries[:2]
+                for move in delivery.move_lines
+            ]
+        )
+        self.assertEqual(deliveries.mapped("rma_count"), [2, 2, 0])
+        self.assertEqual(self.partner.rma_count, 4)
+        action = deliveries[0].action_view_rma()
+        self.assertEqual(self.env["rma"].search(action["domain"]), rmas[:2])
+        single_rma = self._create_rma(self.partner_shipping, self.product, 1)
+        action = self.partner_shipping.action_view_rma()
+        self.assertEqual(action["res_id"], single_rma.id)
+        # The number of queries doesn't depend on the number of records
+        pickings = self.env["stock.picking"].search([], limit=80)
+        self._count_rma_count_queries(deliveries[:1])
+        self.assertEqual(
+            self._count_rma_count_queries(deliveries[:1]),
+            self._count_rma_count_queries(pickings | deliveries),
+        )
+        partners = self.env["res.partner"].search([], limit=80)
+        self._count_rma_count_queries(self.partner)
+        self.assertEqual(
+            self._count_rma_count_queries(self.partner),
+            self._count_rma_count_queries(partners | self.partner),
+        )
+        # The record rules of the RMAs are applied
+        rmas.write({"user_id": False})
+        rmas[0].user_id = self.env.user
+        own_user = self.env["res.users"].create(
+            {
+                "name": "RMA own user",
+                "login": "rma_own_user",
+                "groups_id": [
+                    (4, self.env.ref("rma.rma_group_user_own").id),
+                    (4, self.env.ref("stock.group_stock_user").id),
+                ],
+            }
+        )
+        own_deliveries = deliveries.with_user(own_user)
+        own_deliveries.invalidate_cache(["rma_count"])
+        self.assertEqual(own_deliveries.mapped("rma_count"), [1, 2, 0])
+        self.assertEqual(self.partner.with_user(own_user).rma_count, 3)
+
+    def test_rma_commercial_count(self):
+        contacts = self.partner | self.partner_invoice | self.partner_shipping
+        rmas = self.env["rma"]
+        for contact in contacts:
+            rmas |= self._create_rma(contact, self.product, 1, self.rma_loc)
+        self.assertEqual(
+            self.env["rma"].search([("commercial_partner_id", "=", self.partner.id)]),
+            rmas,
+        )
+        self.assertEqual(contacts.mapped("rma_count"), [1, 1, 1])
+        self.assertEqual(contacts.mapped("rma_commercial_count"), [3, 3, 3])
+        action = self.partner_shipping.action_view_commercial_rma()
+        self.assertEqual(self.env["rma"].search(action["domain"]), rmas)
+        # Moving a contact to another company moves its RMAs too
+        other_company = self.res_partner.create(
+            {"name": "Other company", "is_company": True}
+        )
+        self.partner_shipping.parent_id = other_company
+        self.assertEqual(rmas[2].commercial_partner_id, other_company)
+        contacts.invalidate_cache(["rma_commercial_count"])
+        self.assertEqual(self.partner.rma_commercial_count, 2)
+        self.assertEqual(other_company.rma_commercial_count, 1)
+
+    def test_rma_report_attachment(self):
+        picking = self._create_delivery()
+        attachment_obj = self.env["ir.attachment"]
+        user_file = attachment_obj.create(
+            {
+                "name": "%s.pdf" % picking.name.replace("/", "_"),
+                "datas": base64.b64encode(b"User file"),
+                "res_model": "stock.picking",
+                "res_id": picking.id,
+                "mimetype": "application/pdf",
+            }
+        )
+        attachment = picking._get_rma_report_attachment()
+        self.assertEqual(attachment.description, picking._get_rma_report_version())
+        # The cached slip isn't listed with the picking attachments
+        self.assertEqual(
+            attachment_obj.search(
+                [("res_model", "=", "stock.picking"), ("res_id", "=", picking.id)]
+            ),
+            user_file,
+        )
+        # Cache hit
+        self.assertEqual(picking._get_rma_report_attachment(), attachment)
+        # A stale (or edited) version renders the slip again in the same
+        # attachment
+        attachment.description = "Edited by hand"
+        self.assertEqual(picking._get_rma_report_attachment(), attachment)
+        self.assertEqual(attachment.description, picking._get_rma_report_version())
+        # Duplicated cache attachments are removed, user files are kept
+        duplicate = attachment.copy()
+        self.assertEqual(picking._get_rma_report_attachment(), attachment)
+        self.assertFalse(duplicate.exists())
+        self.assertTrue(user_file.exists())
+
     def test_split(self):
         origin_delivery = self._create_delivery()
         rma_form = Form(self.env["rma"])
@@ -642,6 +955,24 @@ class TestRma(SavepointCase):
         self.assertEqual(new_rma.move_id.quantity_done, 10)
         self.assertEqual(new_rma.reception_move_id.quantity_done, 10)
 
+    def test_split_multi(self):
+        rma = self._create_confirm_receive(self.partner, self.product, 10, self.rma_loc)
+        follower_partner = self.res_partner.create({"name": "Follower"})
+        rma.message_subscribe(follower_partner.ids)
+        rma.create_return(rma.date, 4, rma.product_uom)
+        self.assertEqual(rma.state, "waiting_return")
+        extracted = rma.extract_quantities([1, 2, 3], rma.product_uom)
+        self.assertEqual(extracted.mapped("product_uom_qty"), [1, 2, 3])
+        self.assertEqual(rma.product_uom_qty, 4)
+        self.assertEqual(extracted.mapped("origin_split_rma_id"), rma)
+        self.assertEqual(set(extracted.mapped("state")), {"received"})
+        self.assertEqual(len(set(extracted.mapped("name"))), 3)
+        for new_rma in extracted:
+            self.assertIn(follower_partner, new_rma.message_partner_ids)
+            self.assertEqual(new_rma.reception_move_id, rma.reception_move_id)
+        with self.assertRaises(ValidationError):
+            rma.extract_quantities([3, 2], rma.product_uom)
+
     def test_rma_to_receive_on_delete_invoice(self):
         rma = self._create_confirm_receive(self.partner, self.product, 10, self.rma_loc)
         rma.action_refund()
@@ -664,6 +995,234 @@ class TestRma(SavepointCase):
         rma = self._create_confirm_receive(self.partner, self.product, 10, self.rma_loc)
         self.assertEqual(rma.product_id.qty_available, 0)
 
+    def test_mass_create_names(self):
+        sequence = self.env["ir.sequence"].search(
+            [("code", "=", "rma"), ("company_id", "=", self.company.id)]
+        )
+        team = self.env["rma.team"].search([], limit=1)
+        vals = {"partner_id": self.partner.id, "product_id": self.product.id}
+        for implementation in ("standard", "no_gap"):
+            sequence.implementation = implementation
+            sequence.invalidate_cache()
+            next_number = sequence.number_next_actual
+            rmas = self.env["rma"].create([dict(vals) for __ in range(5)])
+            self.assertEqual(
+                rmas.mapped("name"),
+                [sequence.get_next_char(next_number + i) for i in range(5)],
+            )
+            self.assertEqual(rmas.mapped("team_id"), team)
+            self.assertEqual(
+                self.env["rma"].create(dict(vals)).name,
+                sequence.get_next_char(next_number + 5),
+            )
+
+    def _create_batch_email(self, message_id, subject, to, reply_to=None):
+        message = EmailMessage()
+        message["From"] = "Customer <customer@example.com>"
+        message["To"] = to
+        message["Subject"] = subject
+        message["Message-Id"] = message_id
+        if reply_to:
+            message["In-Reply-To"] = reply_to
+            message["References"] = reply_to
+        message.set_content("%s (body)" % subject)
+        return message
+
+    def test_message_process_batch(self):
+        self.partner.email = "customer@example.com"
+        team = self.env["rma.team"].create(
+            {"name": "Batch team", "alias_name": "rma-batch-test"}
+        )
+        to = "rma-batch-test@example.com"
+        # Local mailbox fixture with the backlog to drain, including a reply
+        # and a reply to that reply to an email of the same backlog
+        path = os.path.join(tempfile.mkdtemp(), "backlog.mbox")
+        box = mailbox.mbox(path)
+        for i in range(200):
+            box.add(
+                self._create_batch_email(
+                    "<rma-batch-%d@example.com>" % i, "Broken product %d" % i, to
+                )
+            )
+            if i == 7:
+                box.add(
+                    self._create_batch_email(
+                        "<rma-batch-reply@example.com>",
+                        "Re: Broken product 7",
+                        to,
+                        "<rma-batch-7@example.com>",
+                    )
+                )
+        box.add(
+            self._create_batch_email(
+                "<rma-batch-reply-2@example.com>",
+                "Re: Re: Broken product 7",
+                to,
+                "<rma-batch-reply@example.com>",
+            )
+        )
+        box.flush()
+        messages = [message.as_bytes() for message in mailbox.mbox(path)]
+        rmas = team.message_process_batch(messages)
+        self.assertEqual(len(rmas), 200)
+        self.assertEqual(rmas.mapped("team_id"), team)
+        self.assertEqual(rmas.mapped("partner_id"), self.partner)
+        self.assertIn("Broken product 7", rmas[7].description)
+        email_message = rmas[7].message_ids.filtered(
+            lambda m: m.message_id == "<rma-batch-7@example.com>"
+        )
+        self.assertEqual(email_message.subtype_id, rmas[7]._creation_subtype())
+        # The replies are posted in the thread of the RMA they answer
+        replies = rmas[7].message_ids.filtered(
+            lambda m: m.message_id
+            in ("<rma-batch-reply@example.com>", "<rma-batch-reply-2@example.com>")
+        )
+        self.assertEqual(len(replies), 2)
+        self.assertEqual(replies.mapped("parent_id"), email_message)
+        # Already processed emails are skipped
+        self.assertFalse(team.message_process_batch(messages[:10]))
+        # Emails sent to another alias are routed there, not batched
+        other_team = self.env["rma.team"].create(
+            {"name": "Other team", "alias_name": "rma-other-test"}
+        )
+        message = self._create_batch_email(
+            "<rma-other@example.com>", "Wrong alias", "rma-other-test@example.com"
+        )
+        self.assertFalse(team.message_process_batch([message.as_bytes()]))
+        other_rma = self.env["rma"].search([("team_id", "=", other_team.id)])
+        self.assertEqual(len(other_rma), 1)
+        self.assertIn("Wrong alias", other_rma.description)
+        # The batch takes fewer queries than processing the emails one by one
+        thread_obj = self.env["mail.thread"]
+        single = [
+            self._create_batch_email(
+                "<rma-single-%d@example.com>" % i, "Single %d" % i, to
+            ).as_bytes()
+            for i in range(11)
+        ]
+        batch = [
+            self._create_batch_email(
+                "<rma-batched-%d@example.com>" % i, "Batched %d" % i, to
+            ).as_bytes()
+            for i in range(11)
+        ]
+        thread_obj.message_process(False, single[0])
+        team.message_process_batch(batch[:1])
+        query_count = self.env.cr.sql_log_count
+        for message in single[1:]:
+            thread_obj.message_process(False, message)
+        single_count = self.env.cr.sql_log_count - query_count
+        query_count = self.env.cr.sql_log_count
+        team.message_process_batch(batch[1:])
+        self.assertLess(self.env.cr.sql_log_count - query_count, single_count)
+
+    def test_fetchmail_batch(self):
+        self.partner.email = "customer@example.com"
+        team = self.env["rma.team"].create(
+            {"name": "Fetchmail team", "alias_name": "rma-fetchmail-test"}
+        )
+        messages = [
+            self._create_batch_email(
+                "<rma-fetchmail-%d@example.com>" % i,
+                "Fetched %d" % i,
+                "rma-fetchmail-test@example.com",
+            ).as_bytes()
+            for i in range(3)
+        ]
+        # The fetched emails are collected instead of being processed
+        mail_batch = []
+        thread_obj = self.env["mail.thread"].with_context(
+            rma_fetchmail_batch=mail_batch
+        )
+        for message in messages:
+            thread_obj.message_process(False, message, strip_attachments=True)
+        self.assertEqual(len(mail_batch), 3)
+        rma_domain = [("team_id", "=", team.id)]
+        self.assertFalse(self.env["rma"].search(rma_domain))
+        server = self.env["fetchmail.server"].create({"name": "RMA server"})
+        team_class = type(self.env["rma.team"])
+        with patch.object(
+            team_class,
+            "message_process_batch",
+            autospec=True,
+            side_effect=team_class.message_process_batch,
+        ) as process_batch:
+            server._process_mail_batch(mail_batch)
+        self.assertEqual(process_batch.call_count, 1)
+        self.assertEqual(len(self.env["rma"].search(rma_domain)), 3)
+
+    def test_warehouse_by_rma_location(self):
+        stock_warehouse = self.env["stock.warehouse"]
+        child_loc = self.env["stock.location"].create(
+            {"name": "RMA child", "location_id": self.rma_loc.id}
+        )
+        rma = self.env["rma"].create(
+            {
+                "partner_id": self.partner.id,
+                "product_id": self.product.id,
+                "location_id": child_loc.id,
+            }
+        )
+        self.assertEqual(rma.warehouse_id, self.warehouse_company)
+        stock_location = self.env.ref("stock.stock_location_stock")
+        self.assertFalse(
+            stock_warehouse._get_warehouses_by_rma_location(stock_location)[
+                stock_location.id
+            ]
+        )
+        # Moving the location out of the RMA location invalidates the cache
+        child_loc.location_id = stock_location
+        self.assertFalse(
+            stock_warehouse._get_warehouses_by_rma_location(child_loc)[child_loc.id]
+        )
+        # Moving a location outside the RMA locations keeps the cache
+        stock_warehouse._get_rma_location_data()
+        child_loc.location_id = self.warehouse_company.view_location_id
+        with self.assertQueryCount(0):
+            stock_warehouse._get_rma_location_data()
+        self.assertEqual(
+            stock_warehouse._get_company_warehouse(self.company),
+            stock_warehouse.search([("company_id", "=", self.company.id)], limit=1),
+        )
+
+    def test_domain_location_id(self):
+        domain = self.env["rma"]._domain_location_id()
+        self.assertIn(self.rma_loc.id, domain[0][2])
+        with self.assertQueryCount(0):
+            self.assertEqual(self.env["rma"]._domain_location_id(), domain)
+        warehouse = self.env["stock.warehouse"].create(
+            {"name": "RMA domain warehouse", "code": "RMADW"}
+        )
+        self.assertIn(
+            warehouse.rma_loc_id.id, self.env["rma"]._domain_location_id()[0][2]
+        )
+
+    def test_convert_uom_quantities(self):
+        unit = self.env.ref("uom.product_uom_unit")
+        dozen = self.env.ref("uom.product_uom_dozen")
+        kgm = self.env.ref("uom.product_uom_kgm")
+        quantities = [
+            (i % 97 + 0.5, (unit, dozen)[i % 2].id, (dozen, unit)[i % 3 > 0].id)
+            for i in range(10000)
+        ]
+        expected = [
+            self.env["uom.uom"]
+            .browse(from_id)
+            ._compute_quantity(qty, self.env["uom.uom"].browse(to_id))
+            for qty, from_id, to_id in quantities
+        ]
+        # The units of measure are read with a single query
+        with self.assertQueryCount(1):
+            result = self.env["rma"]._convert_uom_quantities(quantities)
+        self.assertEqual(result, expected)
+        not_rounded, rounded = self.env["rma"]._convert_uom_quantities(
+            [(7, unit.id, dozen.id, False), (0.25, dozen.id, unit.id, True, "HALF-UP")]
+        )
+        self.assertAlmostEqual(not_rounded, 7 / 12)
+        self.assertEqual(rounded, 3)
+        with self.assertRaises(UserError):
+            self.env["rma"]._convert_uom_quantities([(1, unit.id, kgm.id)])
+
     def test_autoconfirm_email(self):
         rma = self._create_rma(self.partner, self.product, 10, self.rma_loc)
         rma.company_id.send_rma_confirmation = True
@@ -681,3 +1240,40 @@ class TestRma(SavepointCase):
         self.assertTrue(rma.name in mail.subject)
         self.assertTrue(rma.name in mail.body)
         self.assertEqual(self.env.ref("rma.mt_rma_notification"), mail.subtype_id)
+
+    def test_autoconfirm_email_queued(self):
+        self.partner.email = "partner@example.com"
+        self.company.send_rma_confirmation = True
+        self.company.rma_confirmation_mail_queued = True
+        self.company.rma_mail_confirmation_template_id = self.env.ref(
+            "rma.mail_template_rma_notification"
+        )
+        rma_1 = self._create_rma(self.partner, self.product, 10, self.rma_loc)
+        rma_2 = self._create_rma(self.partner, self.product, 5, self.rma_loc)
+        rmas = rma_1 | rma_2
+        mail_server = type(self.env["ir.mail_server"])
+        # Local SMTP stand-in: no email leaves on confirmation, they are sent
+        # when the mail queue is processed.
+        with patch.object(mail_server, "send_email", return_value="<id>") as send:
+            rmas.action_confirm()
+            send.assert_not_called()
+            self.assertTrue(all(rmas.mapped("sent")))
+            mails = self.env["mail.mail"].search(
+                [
+                    ("model", "=", "rma"),
+                    ("res_id", "in", rmas.ids),
+                    ("state", "=", "outgoing"),
+                ]
+            )
+            self.assertEqual(set(mails.mapped("res_id")), set(rmas.ids))
+            for rma in rmas:
+                message = mails.filtered(lambda m: m.res_id == rma.id)
+                self.assertIn(rma.name, message.subject)
+            stats = self.env["rma"]._get_confirmation_mail_queue_stats()
+            self.assertEqual(stats["depth"], len(mails))
+            self.assertGreaterEqual(stats["latency"], 0)
+            settings = self.env["res.config.settings"].create({})
+            self.assertEqual(settings.rma_confirmation_mail_queue_depth, len(mails))
+            mails.send()
+            self.assertEqual(send.call_count, len(mails))
+        self.assertFalse(self.env["rma"]._get_confirmation_mail_queue_stats()["depth"])
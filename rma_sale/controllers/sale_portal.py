@@ -1,8 +1,10 @@
 # Copyright 2020 Tecnativa - Ernesto Tejeda
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+from werkzeug.urls import url_encode
+
 from odoo import _, http
-from odoo.exceptions import AccessError, MissingError
+from odoo.exceptions import AccessError, MissingError, ValidationError
 from odoo.http import request
 
 from odoo.addons.sale.controllers.portal import CustomerPortal
@@ -23,41 +25,108 @@ class CustomerPortal(CustomerPortal):
             )
         except (AccessError, MissingError):
             return request.redirect("/my")
-        order_obj = request.env["sale.order"]
-        wizard_obj = request.env["sale.order.rma.wizard"]
-        wizard_line_field_types = {
-            f: d["type"] for f, d in wizard_obj.line_ids.fields_get().items()
-        }
-        # Set wizard line vals
-        mapped_vals = {}
         partner_shipping_id = post.pop("partner_shipping_id", False)
+        # Form inputs are named '<row>-<field name>'
+        rows = {}
         for name, value in post.items():
-            row, field_name = name.split("-", 1)
-            if wizard_line_field_types.get(field_name) == "many2one":
-                value = int(value) if value else False
-            mapped_vals.setdefault(row, {}).update({field_name: value})
-        # If no operation is filled, no RMA will be created
-        line_vals = [
-            (0, 0, vals) for vals in mapped_vals.values() if vals.get("operation_id")
-        ]
-        # Create wizard an generate rmas
-        order = order_obj.browse(order_id).sudo()
-        location_id = order.warehouse_id.rma_loc_id.id
-        wizard = wizard_obj.with_context(active_id=order_id).create(
+            row, sep, field_name = name.partition("-")
+            if sep:
+                rows.setdefault(row, {})[field_name] = value
+        try:
+            rma = self._create_portal_rma(
+                order_sudo, list(rows.values()), partner_shipping_id
+            )
+        except ValidationError as e:
+            # The error is shown in the order page
+            return request.redirect(
+                order_sudo.get_portal_url(
+                    query_string="&%s" % url_encode({"rma_error": e.name})
+                )
+            )
+        if len(rma) == 0:
+            route = order_sudo.get_portal_url()
+        else:
+            route = "/my/rmas?sale_id=%d" % order_id
+        return request.redirect(route)
+
+    @http.route(
+        ["/my/orders/<int:order_id>/requestrma/json"],
+        type="json",
+        auth="public",
+        methods=["POST"],
+        website=True,
+    )
+    def request_rma_json(
+        self, order_id, access_token=None, lines=None, partner_shipping_id=None
+    ):
+        """ Scripted variant of request_rma. The lines are a list of dicts
+        with the same field names as the portal form.
+        """
+        try:
+            order_sudo = self._document_check_access(
+                "sale.order", order_id, access_token=access_token
+            )
+        except (AccessError, MissingError):
+            return {"error": _("You don't have access to this sale order.")}
+        if not isinstance(lines, list) or not all(
+            isinstance(line, dict) for line in lines
+        ):
+            return {"error": _("The lines must be a list of objects.")}
+        try:
+            rma = self._create_portal_rma(order_sudo, lines, partner_shipping_id)
+        except ValidationError as e:
+            return {"error": e.name}
+        return {"rmas": [{"id": r.id, "name": r.name} for r in rma]}
+
+    def _create_portal_rma(self, order_sudo, rows, partner_shipping_id=False):
+        """ Create the RMAs requested from the portal for a sale order.
+
+        :param rows: list of dicts {wizard line field name: raw value}
+        :return: the created RMAs
+        """
+        partner_shipping = self._get_portal_rma_shipping_address(
+            order_sudo, partner_shipping_id
+        )
+        wizard_obj = request.env["sale.order.rma.wizard"]
+        line_vals = request.env["sale.order.line.rma.wizard"]._prepare_portal_line_vals(
+            rows
+        )
+        # Only the lines and quantities the order can return are accepted
+        line_vals = order_sudo._get_portal_rma_line_vals(line_vals)
+        wizard = wizard_obj.with_context(active_id=order_sudo.id).create(
             {
-                "line_ids": line_vals,
-                "location_id": location_id,
-                "partner_shipping_id": partner_shipping_id,
+                "line_ids": [(0, 0, vals) for vals in line_vals],
+                "location_id": order_sudo.warehouse_id.rma_loc_id.id,
+                "partner_shipping_id": partner_shipping.id,
             }
         )
         rma = wizard.sudo().create_rma(from_portal=True)
-        for rec in rma:
-            rec.origin += _(" (Portal)")
         # Add the user as follower of the created RMAs so they can
         # later view them.
         rma.message_subscribe([request.env.user.partner_id.id])
-        if len(rma) == 0:
-            route = order_sudo.get_portal_url()
-        else:
-            route = "/my/rmas?sale_id=%d" % order_id
-        return request.redirect(route)
+        return rma
+
+    def _get_portal_rma_shipping_address(self, order_sudo, partner_shipping_id):
+        """ Shipping address requested for the RMAs, which must be one of
+        the addresses offered in the portal for the order.
+
+        :return: res.partner record, empty when no address was requested
+        """
+        partner_obj = request.env["res.partner"].sudo()
+        if not partner_shipping_id:
+            return partner_obj
+        try:
+            partner_shipping_id = int(partner_shipping_id)
+        except (TypeError, ValueError):
+            partner_shipping_id = False
+        commercial_partner = order_sudo.partner_id.commercial_partner_id
+        addresses = (
+            commercial_partner.child_ids.filtered(
+                lambda x: x.type in ["contact", "delivery"]
+            )
+            | order_sudo.partner_id
+            | order_sudo.partner_shipping_id
+        )
+        if partner_shipping_id not in addresses.ids:
+            raise ValidationError(_("Invalid shipping address."))
+        return partner_obj.browse(partner_shipping_id)
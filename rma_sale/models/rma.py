@@ -78,12 +78,12 @@ class Rma(models.Model):
     def _onchange_order_id(self):
         self.product_id = self.picking_id = False
 
-    def _prepare_refund(self, invoice_form, origin):
+    def _prepare_refund_vals(self, origin=False):
         """Inject salesman from sales order (if any)"""
-        res = super()._prepare_refund(invoice_form, origin)
+        vals = super()._prepare_refund_vals(origin)
         if self.order_id:
-            invoice_form.invoice_user_id = self.order_id.user_id
-        return res
+            vals["invoice_user_id"] = self.order_id.user_id.id
+        return vals
 
     def _get_refund_line_price_unit(self):
         """Get the sale order price unit"""
@@ -98,10 +98,10 @@ class Rma(models.Model):
             return super()._get_refund_line_product()
         return self.sale_line_id.product_id
 
-    def _prepare_refund_line(self, line_form):
+    def _prepare_refund_line_vals(self, fiscal_position=None):
         """Add line data"""
-        super()._prepare_refund_line(line_form)
+        vals = super()._prepare_refund_line_vals(fiscal_position)
         line = self.sale_line_id
         if line:
-            line_form.discount = line.discount
-            line_form.sequence = line.sequence
+            vals.update(discount=line.discount, sequence=line.sequence)
+        return vals
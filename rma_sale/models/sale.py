@@ -3,24 +3,26 @@
 
 from odoo import _, api, fields, models
 from odoo.exceptions import ValidationError
+from odoo.tools import float_compare
 
 
 class SaleOrder(models.Model):
-    _inherit = "sale.order"
+    _name = "sale.order"
+    _inherit = ["sale.order", "rma.count.mixin"]
+    _rma_count_field = "order_id"
 
     # RMAs that were created from a sale order
     rma_ids = fields.One2many(
         comodel_name="rma", inverse_name="order_id", string="RMAs", copy=False,
     )
-    rma_count = fields.Integer(string="RMA count", compute="_compute_rma_count")
-
-    def _compute_rma_count(self):
-        rma_data = self.env["rma"].read_group(
-            [("order_id", "in", self.ids)], ["order_id"], ["order_id"]
-        )
-        mapped_data = {r["order_id"][0]: r["order_id_count"] for r in rma_data}
-        for record in self:
-            record.rma_count = mapped_data.get(record.id, 0)
+    # Index of the order shared by the lines of the RMA wizards. It's only a
+    # container for the ORM cache, which keeps it for the whole transaction
+    # and drops it when the order lines or their moves change.
+    rma_wizard_index = fields.Binary(
+        compute="_compute_rma_wizard_index",
+        attachment=False,
+        groups="base.group_no_one",
+    )
 
     def _prepare_rma_wizard_line_vals(self, data):
         """So we can extend the wizard easily"""
@@ -56,26 +58,160 @@ class SaleOrder(models.Model):
         }
 
     def action_view_rma(self):
-        self.ensure_one()
-        action = self.env.ref("rma.rma_action").read()[0]
-        rma = self.rma_ids
-        if len(rma) == 1:
-            action.update(
-                res_id=rma.id, view_mode="form", views=[],
-            )
-        else:
-            action["domain"] = [("id", "in", rma.ids)]
+        action = super().action_view_rma()
         # reset context to show all related rma without default filters
         action["context"] = {}
         return action
 
     def get_delivery_rma_data(self):
         self.ensure_one()
+        # The returnable quantities of all the moves of the order are
+        # resolved at once
+        quantities = self.order_line.mapped("move_ids")._get_rma_returnable_quantities()
         data = []
         for line in self.order_line:
-            data += line.prepare_sale_rma_data()
+            data += line.prepare_sale_rma_data(returnable_quantities=quantities)
         return data
 
+    def _get_portal_rma_data_key(self, data):
+        """ Key that identifies a row of get_delivery_rma_data in the lines
+        requested from the portal.
+
+        Hook method invoked by:
+        sale.order._get_portal_rma_line_vals
+        """
+        return (
+            data["sale_line_id"].id,
+            data["picking"] and data["picking"].id,
+            data["product"].id,
+        )
+
+    def _get_portal_rma_vals_key(self, vals):
+        """ Key of a line requested from the portal, matching the one of
+        its row in get_delivery_rma_data.
+
+        Hook method invoked by:
+        sale.order._get_portal_rma_line_vals
+        """
+        return (
+            vals.get("sale_line_id") or False,
+            vals.get("picking_id") or False,
+            vals.get("product_id") or False,
+        )
+
+    def _get_portal_rma_line_vals(self, line_vals):
+        """ Check the lines requested from the portal against the returnable
+        quantities of the order and rebuild their values from the order
+        data, so only the quantity, unit of measure, operation and
+        description are taken from the request.
+
+        :param line_vals: list of wizard line values as returned by
+            [sale.order.line.rma.wizard]._prepare_portal_line_vals
+        :return: list of wizard line values
+        """
+        self.ensure_one()
+        returnable = {}
+        for data in self.get_delivery_rma_data():
+            key = self._get_portal_rma_data_key(data)
+            if key in returnable:
+                returnable[key]["quantity"] += data["quantity"]
+            else:
+                returnable[key] = {"data": data, "quantity": data["quantity"]}
+        operation_ids = set(self.env["rma.operation"].search([]).ids)
+        uom_obj = self.env["uom.uom"]
+        requested = {}
+        result = []
+        for vals in line_vals:
+            key = self._get_portal_rma_vals_key(vals)
+            if key not in returnable:
+                raise ValidationError(_("The requested product can't be returned."))
+            data = returnable[key]["data"]
+            quantity = vals.get("quantity", 0.0)
+            uom = uom_obj.browse(vals.get("uom_id") or data["uom"].id).exists()
+            if quantity < 0 or not uom or uom.category_id != data["uom"].category_id:
+                raise ValidationError(
+                    _("Invalid quantity requested for the product %s.")
+                    % data["product"].display_name
+                )
+            if vals.get("operation_id") not in operation_ids:
+                raise ValidationError(_("Invalid operation requested."))
+            requested[key] = requested.get(key, 0.0) + uom._compute_quantity(
+                quantity, data["uom"], round=False
+            )
+            if (
+                float_compare(
+                    requested[key],
+                    returnable[key]["quantity"],
+                    precision_rounding=data["uom"].rounding,
+                )
+                > 0
+            ):
+                raise ValidationError(
+                    _(
+                        "The quantity requested for the product %s exceeds "
+                        "the quantity that can be returned."
+                    )
+                    % data["product"].display_name
+                )
+            line = self._prepare_rma_wizard_line_vals(data)
+            line.update(
+                {
+                    "quantity": quantity,
+                    "uom_id": uom.id,
+                    "operation_id": vals["operation_id"],
+                    "description": vals.get("description", False),
+                }
+            )
+            result.append(line)
+        return result
+
+    @api.depends(
+        "order_line.product_id",
+        "order_line.move_ids",
+        "order_line.move_ids.picking_id",
+        "order_line.move_ids.product_id",
+    )
+    def _compute_rma_wizard_index(self):
+        for order in self:
+            order.rma_wizard_index = order._get_rma_wizard_index()
+
+    def _get_rma_wizard_index(self):
+        """ Index the products, delivery pickings and moves of the order in
+        a single pass over its lines, to be shared by all the lines of an
+        RMA wizard.
+
+        :return: dict with:
+            'product_ids': product ids of the order lines
+            'picking_ids': {product id: ids of the pickings of its moves}
+            'move_ids': {(picking id, sale line id): ids of the line moves}
+            'product_move_ids': {(picking id, sale line id, product id):
+                                 ids of the line moves of that product}
+        """
+        self.ensure_one()
+        product_ids = {}
+        picking_ids = {}
+        move_ids = {}
+        product_move_ids = {}
+        for line in self.order_line:
+            product_id = line.product_id.id
+            product_ids.setdefault(product_id)
+            product_pickings = picking_ids.setdefault(product_id, {})
+            for move in line.move_ids:
+                product_pickings.setdefault(move.picking_id.id)
+                move_ids.setdefault((move.picking_id.id, line.id), []).append(move.id)
+                product_move_ids.setdefault(
+                    (move.picking_id.id, line.id, move.product_id.id), []
+                ).append(move.id)
+        return {
+            "product_ids": [x for x in product_ids if x],
+            "picking_ids": {
+                product_id: [x for x in pickings if x]
+                for product_id, pickings in picking_ids.items()
+            },
+            "move_ids": move_ids,
+            "product_move_ids": product_move_ids,
+        }
+
     @api.depends("rma_ids.refund_id")
     def _get_invoiced(self):
         """Search for possible RMA refunds and link them to the order. We
@@ -108,45 +244,33 @@ class SaleOrderLine(models.Model):
             )
         )
 
-    def prepare_sale_rma_data(self):
+    def prepare_sale_rma_data(self, returnable_quantities=None):
+        """ :param returnable_quantities: dict {move_id: quantity} as
+        returned by [stock.move]._get_rma_returnable_quantities. It's
+        computed for the delivery moves of the line when not given.
+        """
         self.ensure_one()
-        # Method helper to filter chained moves
-
-        def destination_moves(_move):
-            return _move.mapped("move_dest_ids").filtered(
-                lambda r: r.state in ["partially_available", "assigned", "done"]
-            )
-
         product = self.product_id
         if self.product_id.type not in ["product", "consu"]:
             return {}
         moves = self.get_delivery_move()
         data = []
         if moves:
+            # Look for chained moves to check how many items we can allow
+            # to return. When a product is re-delivered it should be
+            # allowed to open an RMA again on it.
+            returnable_quantities = returnable_quantities or {}
+            missing_moves = moves.filtered(lambda m: m.id not in returnable_quantities)
+            if missing_moves:
+                returnable_quantities = {
+                    **returnable_quantities,
+                    **missing_moves._get_rma_returnable_quantities(),
+                }
             for move in moves:
-                # Look for chained moves to check how many items we can allow
-                # to return. When a product is re-delivered it should be
-                # allowed to open an RMA again on it.
-                qty = move.product_uom_qty
-                qty_returned = 0
-                move_dest = destination_moves(move)
-                # With the return of the return of the return we could have an
-                # infinite loop, so we should avoid it dropping already explored
-                # move_dest_ids
-                visited_moves = move + move_dest
-                while move_dest:
-                    qty_returned -= sum(move_dest.mapped("product_uom_qty"))
-                    move_dest = destination_moves(move_dest) - visited_moves
-                    if move_dest:
-                        visited_moves += move_dest
-                        qty += sum(move_dest.mapped("product_uom_qty"))
-                        move_dest = destination_moves(move_dest) - visited_moves
-                # If by chance we get a negative qty we should ignore it
-                qty = max(0, sum((qty, qty_returned)))
                 data.append(
                     {
                         "product": move.product_id,
-                        "quantity": qty,
+                        "quantity": returnable_quantities[move.id],
                         "uom": move.product_uom,
                         "picking": move.picking_id,
                         "sale_line_id": self,
@@ -11,3 +11,59 @@ class StockMove(models.Model):
         res = super()._prepare_return_rma_vals(original_picking)
         res.update(order_id=original_picking.sale_id.id)
         return res
+
+    def _get_rma_returnable_quantities(self):
+        """ Quantity of each move in self that can still be put in an RMA:
+        the move quantity minus the returns chained to it (move_dest_ids),
+        plus the re-deliveries of those returns, and so on. Only the chained
+        moves that are reserved or done are followed. The chains of all the
+        moves are walked level by level, with one query per level, with the
+        same rules as the former walk of each move: a move is counted once
+        per level, and the moves already visited are dropped, being visited
+        the first returns and the re-deliveries but not the returns of the
+        re-deliveries.
+        invoked by: [sale.order].get_delivery_rma_data and
+                    [sale.order.line].prepare_sale_rma_data
+
+        :return: dict {move_id: quantity}
+        """
+        if not self.ids:
+            return {}
+        self.flush(["state", "product_uom_qty", "move_dest_ids"])
+        states = ("partially_available", "assigned", "done")
+        chained_qty = dict.fromkeys(self.ids, 0.0)
+        visited = {move_id: {move_id} for move_id in self.ids}
+        # {move id: ids of the root moves whose chain reached it}
+        frontier = {move_id: {move_id} for move_id in self.ids}
+        level = 1
+        while frontier:
+            self.env.cr.execute(
+                """
+                SELECT rel.move_orig_id, rel.move_dest_id, sm.product_uom_qty
+                FROM stock_move_move_rel rel
+                JOIN stock_move sm ON sm.id = rel.move_dest_id
+                WHERE rel.move_orig_id IN %s AND sm.state IN %s
+                """,
+                (tuple(frontier), states),
+            )
+            sign = 1 if level % 2 == 0 else -1
+            next_frontier = {}
+            for orig_id, dest_id, qty in self.env.cr.fetchall():
+                for root_id in frontier[orig_id]:
+                    if dest_id in visited[root_id] or root_id in next_frontier.get(
+                        dest_id, ()
+                    ):
+                        continue
+                    chained_qty[root_id] += sign * qty
+                    next_frontier.setdefault(dest_id, set()).add(root_id)
+            if level == 1 or not level % 2:
+                for dest_id, root_ids in next_frontier.items():
+                    for root_id in root_ids:
+                        visited[root_id].add(dest_id)
+            frontier = next_frontier
+            level += 1
+        # If by chance we get a negative qty we should ignore it
+        return {
+            move.id: max(0, move.product_uom_qty + chained_qty[move.id])
+            for move in self
+        }
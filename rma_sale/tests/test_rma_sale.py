@@ -1,6 +1,9 @@
 # Copyright 2020 Tecnativa - Ernesto Tejeda
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+from unittest.mock import patch
+
+from odoo.exceptions import ValidationError
 from odoo.tests import Form, SavepointCase
 
 
@@ -114,3 +117,242 @@ class TestRmaSale(SavepointCase):
             rma.product_uom_qty,
             "We should be allowed to return the product again",
         )
+        delivery_move = rma.move_id
+        self.assertEqual(
+            delivery_move._get_rma_returnable_quantities(),
+            {delivery_move.id: rma.product_uom_qty},
+        )
+
+    def _create_delivered_order(self, line_count):
+        products = self.product_product.create(
+            [
+                {"name": "Product delivered %s" % i, "type": "product"}
+                for i in range(line_count)
+            ]
+        )
+        order = self.sale_order.create(
+            {
+                "partner_id": self.partner.id,
+                "order_line": [
+                    (0, 0, {"product_id": product.id, "product_uom_qty": 2})
+                    for product in products
+                ],
+            }
+        )
+        order.action_confirm()
+        picking = order.picking_ids
+        for move in picking.move_lines:
+            move.quantity_done = move.product_uom_qty
+        picking.button_validate()
+        return order, picking
+
+    def test_rma_wizard_large_order(self):
+        order, picking = self._create_delivered_order(150)
+        wizard = self._rma_sale_wizard(order)
+        lines = wizard.line_ids
+        self.assertEqual(len(lines), 150)
+        lines.invalidate_cache()
+        order.invalidate_cache(["rma_wizard_index"])
+        sale_order_class = type(self.env["sale.order"])
+        with patch.object(
+            sale_order_class,
+            "_get_rma_wizard_index",
+            autospec=True,
+            side_effect=sale_order_class._get_rma_wizard_index,
+        ) as index_mock:
+            self.assertEqual(set(lines.mapped("allowed_picking_ids").ids), {picking.id})
+            lines.mapped("allowed_product_ids")
+            lines.mapped("move_id")
+            # Changing the lines doesn't build the index again
+            lines[0].sale_line_id = lines[1].sale_line_id
+            lines[0].product_id = lines[1].product_id
+            self.assertEqual(lines[0].move_id, lines[1].move_id)
+            lines[0].picking_id = False
+            self.assertFalse(lines[0].move_id)
+        # The index of the order is built once for all the lines and fields
+        self.assertEqual(index_mock.call_count, 1)
+        for line in lines[1:]:
+            self.assertEqual(
+                line.allowed_product_ids, order.order_line.mapped("product_id")
+            )
+            self.assertEqual(line.move_id, line.sale_line_id.move_ids)
+            self.assertEqual(line.move_id.picking_id, picking)
+
+    def test_create_and_open_rma_large_delivery(self):
+        order, picking = self._create_delivered_order(200)
+        wizard = self._rma_sale_wizard(order)
+        action = wizard.create_and_open_rma()
+        rmas = self.env["rma"].search(action["domain"])
+        self.assertEqual(len(rmas), 200)
+        self.assertEqual(set(rmas.mapped("state")), {"confirmed"})
+        reception = rmas.mapped("reception_move_id.picking_id")
+        self.assertEqual(len(reception), 1)
+        self.assertEqual(len(reception.move_lines), 200)
+        self.assertEqual(order.picking_ids, picking + reception)
+        for rma in rmas:
+            self.assertEqual(rma.reception_move_id.origin_returned_move_id, rma.move_id)
+            self.assertEqual(rma.reception_move_id.product_uom_qty, 2)
+            self.assertTrue(
+                any(order.name in body for body in rma.message_ids.mapped("body"))
+            )
+
+    def test_portal_line_vals(self):
+        line_obj = self.env["sale.order.line.rma.wizard"]
+        operation = self.env["rma.operation"].search([], limit=1)
+        rows = [
+            {
+                "product_id": str(self.product_1.id),
+                "sale_line_id": str(self.order_line.id),
+                "quantity": "3",
+                "uom_id": str(self.product_1.uom_id.id),
+                "picking_id": str(self.order_out_picking.id),
+                "operation_id": str(operation.id),
+                "description": "Broken",
+                "unknown_field": "1",
+            },
+            {"product_id": str(self.product_1.id), "operation_id": ""},
+        ]
+        line_vals = line_obj._prepare_portal_line_vals(rows)
+        self.assertEqual(
+            line_vals,
+            [
+                {
+                    "product_id": self.product_1.id,
+                    "sale_line_id": self.order_line.id,
+                    "quantity": 3.0,
+                    "uom_id": self.product_1.uom_id.id,
+                    "picking_id": self.order_out_picking.id,
+                    "operation_id": operation.id,
+                    "description": "Broken",
+                }
+            ],
+        )
+        with self.assertRaises(ValidationError):
+            line_obj._prepare_portal_line_vals([{"quantity": "three"}])
+        # The requested lines are checked against the order
+        checked_vals = self.sale_order._get_portal_rma_line_vals(line_vals)
+        self.assertEqual(len(checked_vals), 1)
+        self.assertEqual(
+            {name: checked_vals[0][name] for name in line_vals[0]}, line_vals[0]
+        )
+        for wrong_vals in (
+            {"product_id": self.product_2.id},
+            {"picking_id": False},
+            {"quantity": 6.0},
+            {"quantity": -1.0},
+            {"operation_id": operation.id + 1000},
+        ):
+            with self.assertRaises(ValidationError):
+                self.sale_order._get_portal_rma_line_vals(
+                    [dict(line_vals[0], **wrong_vals)]
+                )
+        # The quantity can't exceed the returnable one over several lines
+        with self.assertRaises(ValidationError):
+            self.sale_order._get_portal_rma_line_vals(line_vals * 2)
+        wizard = (
+            self.env["sale.order.rma.wizard"]
+            .with_context(active_id=self.sale_order.id)
+            .create(
+                {
+                    "line_ids": [(0, 0, vals) for vals in line_vals],
+                    "location_id": self.sale_order.warehouse_id.rma_loc_id.id,
+                }
+            )
+        )
+        rma = wizard.create_rma(from_portal=True)
+        self.assertEqual(rma.origin, "%s (Portal)" % self.sale_order.name)
+        self.assertEqual(rma.move_id, self.order_out_picking.move_lines)
+
+    def test_rma_count(self):
+        wizard = self._rma_sale_wizard(self.sale_order)
+        rma = self.env["rma"].browse(wizard.create_and_open_rma()["res_id"])
+        self.assertEqual(self.sale_order.rma_count, 1)
+        action = self.sale_order.action_view_rma()
+        self.assertEqual(action["res_id"], rma.id)
+        self.assertEqual(action["context"], {})
+        orders = self.env["sale.order"].search([], limit=80) | self.sale_order
+        counts = []
+        for records in (self.sale_order, self.sale_order, orders):
+            records.invalidate_cache(["rma_count"])
+            query_count = self.env.cr.sql_log_count
+            records.mapped("rma_count")
+            counts.append(self.env.cr.sql_log_count - query_count)
+        # The number of queries doesn't depend on the number of orders
+        self.assertEqual(counts[1], counts[2])
+
+    def test_rma_returnable_quantities_branching(self):
+        delivery_move = self.order_out_picking.move_lines
+        customer_location = delivery_move.location_dest_id
+        stock_location = delivery_move.location_id
+
+        def create_move(qty, origins, state="done", to_customer=False):
+            move = self.env["stock.move"].create(
+                {
+                    "name": "Chained move",
+                    "product_id": self.product_1.id,
+                    "product_uom_qty": qty,
+                    "product_uom": self.product_1.uom_id.id,
+                    "location_id": (
+                        to_customer and stock_location or customer_location
+                    ).id,
+                    "location_dest_id": (
+                        to_customer and customer_location or stock_location
+                    ).id,
+                    "move_orig_ids": [(6, 0, origins.ids)],
+                }
+            )
+            move.write({"state": state})
+            return move
+
+        # Two returns of the delivery merged again in one re-delivery, which
+        # is reached twice but only counted once
+        return_1 = create_move(2, delivery_move)
+        return_2 = create_move(1, delivery_move)
+        redelivery = create_move(1, return_1 | return_2, to_customer=True)
+        # Moves not reserved nor done are not followed
+        create_move(1, redelivery, state="draft")
+        self.assertEqual(
+            delivery_move._get_rma_returnable_quantities(), {delivery_move.id: 3}
+        )
+        self.assertEqual(self._walk_returnable_quantity(delivery_move), 3)
+        # A chain of diamonds doesn't multiply the moves reached
+        origins = redelivery
+        for __ in range(10):
+            branch_1 = create_move(0, origins)
+            branch_2 = create_move(0, origins)
+            origins = create_move(0, branch_1 | branch_2, to_customer=True)
+        self.assertEqual(
+            delivery_move._get_rma_returnable_quantities(), {delivery_move.id: 3}
+        )
+        self.assertEqual(self._walk_returnable_quantity(delivery_move), 3)
+        # The returns of the re-deliveries aren't marked as visited, so a
+        # return reached again through a cycle is subtracted again
+        chained_return = create_move(1, origins)
+        chained_redelivery = create_move(1, chained_return, to_customer=True)
+        chained_return.move_orig_ids = [(4, chained_redelivery.id)]
+        self.assertEqual(
+            delivery_move._get_rma_returnable_quantities(), {delivery_move.id: 2}
+        )
+        self.assertEqual(self._walk_returnable_quantity(delivery_move), 2)
+
+    def _walk_returnable_quantity(self, move):
+        """ Former walk of the chained moves, one move at a time """
+
+        def destination_moves(_move):
+            return _move.mapped("move_dest_ids").filtered(
+                lambda r: r.state in ["partially_available", "assigned", "done"]
+            )
+
+        move.invalidate_cache()
+        qty = move.product_uom_qty
+        qty_returned = 0
+        move_dest = destination_moves(move)
+        visited_moves = move + move_dest
+        while move_dest:
+            qty_returned -= sum(move_dest.mapped("product_uom_qty"))
+            move_dest = destination_moves(move_dest) - visited_moves
+            if move_dest:
+                visited_moves += move_dest
+                qty += sum(move_dest.mapped("product_uom_qty"))
+                move_dest = destination_moves(move_dest) - visited_moves
+        return max(0, sum((qty, qty_returned)))
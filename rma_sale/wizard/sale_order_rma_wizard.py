@@ -1,7 +1,8 @@
 # Copyright 2020 Tecnativa - Ernesto Tejeda
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from odoo import _, api, fields, models
+from odoo import _, api, fields, models, tools
+from odoo.exceptions import ValidationError
 
 
 class SaleOrderRmaWizard(models.TransientModel):
@@ -9,8 +10,8 @@ class SaleOrderRmaWizard(models.TransientModel):
     _description = "Sale Order Rma Wizard"
 
     def _domain_location_id(self):
-        rma_loc = self.env["stock.warehouse"].search([]).mapped("rma_loc_id")
-        return [("id", "child_of", rma_loc.ids)]
+        rma_loc_ids = self.env["stock.warehouse"]._get_rma_root_location_ids()
+        return [("id", "child_of", rma_loc_ids)]
 
     order_id = fields.Many2one(
         comodel_name="sale.order",
@@ -42,6 +43,9 @@ class SaleOrderRmaWizard(models.TransientModel):
         self.ensure_one()
         lines = self.line_ids.filtered(lambda r: r.quantity > 0.0)
         val_list = [line._prepare_rma_values() for line in lines]
+        if from_portal:
+            for vals in val_list:
+                vals["origin"] = (vals.get("origin") or "") + _(" (Portal)")
         rma = self.env["rma"].create(val_list)
         # post messages
         msg_list = [
@@ -53,11 +57,14 @@ class SaleOrderRmaWizard(models.TransientModel):
             self.order_id.message_post(body=_(msg + " has been created."))
         elif len(msg_list) > 1:
             self.order_id.message_post(body=_(msg + " have been created."))
-        rma.message_post_with_view(
-            "mail.message_origin_link",
-            values={"self": rma, "origin": self.order_id},
-            subtype_id=self.env.ref("mail.mt_note").id,
+        # The origin link is the same for all the RMAs, so it's rendered
+        # only once and logged in all of them at once
+        body = self.env.ref("mail.message_origin_link").render(
+            {"self": rma, "origin": self.order_id},
+            engine="ir.qweb",
+            minimal_qcontext=True,
         )
+        rma._message_log_batch({r.id: body for r in rma})
         return rma
 
     def create_and_open_rma(self):
@@ -65,8 +72,7 @@ class SaleOrderRmaWizard(models.TransientModel):
         rma = self.create_rma()
         if not rma:
             return
-        for rec in rma:
-            rec.action_confirm()
+        rma.action_confirm()
         action = self.env.ref("rma.rma_action").read()[0]
         if len(rma) > 1:
             action["domain"] = [("id", "in", rma.ids)]
@@ -89,7 +95,7 @@ class SaleOrderLineRmaWizard(models.TransientModel):
         ),
     )
     allowed_product_ids = fields.Many2many(
-        comodel_name="product.product", compute="_compute_allowed_product_ids"
+        comodel_name="product.product", compute="_compute_from_order_index"
     )
     product_id = fields.Many2one(
         comodel_name="product.product",
@@ -110,14 +116,16 @@ class SaleOrderLineRmaWizard(models.TransientModel):
         required=True,
     )
     allowed_picking_ids = fields.Many2many(
-        comodel_name="stock.picking", compute="_compute_allowed_picking_ids"
+        comodel_name="stock.picking", compute="_compute_from_order_index"
     )
     picking_id = fields.Many2one(
         comodel_name="stock.picking",
         string="Delivery order",
         domain="[('id', 'in', allowed_picking_ids)]",
     )
-    move_id = fields.Many2one(comodel_name="stock.move", compute="_compute_move_id")
+    move_id = fields.Many2one(
+        comodel_name="stock.move", compute="_compute_from_order_index"
+    )
     operation_id = fields.Many2one(
         comodel_name="rma.operation", string="Requested operation",
     )
@@ -129,33 +137,114 @@ class SaleOrderLineRmaWizard(models.TransientModel):
         self.picking_id = False
         self.uom_id = self.product_id.uom_id
 
-    @api.depends("picking_id")
-    def _compute_move_id(self):
-        for record in self:
-            if record.picking_id:
-                record.move_id = record.picking_id.move_lines.filtered(
-                    lambda r: (
-                        r.sale_line_id == record.sale_line_id
-                        and r.sale_line_id.product_id == record.product_id
-                        and r.sale_line_id.order_id == record.order_id
+    @api.model
+    def _get_portal_fields(self):
+        """ Hook method for the names of the line fields that can be filled
+        in a portal RMA request.
+
+        invoked by:
+        sale.order.line.rma.wizard._get_portal_field_types
+        """
+        return [
+            "product_id",
+            "sale_line_id",
+            "quantity",
+            "uom_id",
+            "picking_id",
+            "operation_id",
+            "description",
+        ]
+
+    @api.model
+    @tools.ormcache()
+    def _get_portal_field_types(self):
+        """ Types of the line fields that can be filled in a portal RMA
+        request, cached per registry as they only depend on the installed
+        modules.
+        """
+        return {
+            name: self._fields[name].type
+            for name in self._get_portal_fields()
+            if name in self._fields
+        }
+
+    @api.model
+    def _prepare_portal_line_vals(self, rows):
+        """ Validate and convert the raw values of a portal RMA request in a
+        single pass. Unknown fields are ignored and rows with no requested
+        operation are discarded, as no RMA will be created for them.
+
+        :param rows: list of dicts {field name: raw value}
+        :return: list of wizard line values
+        """
+        field_types = self._get_portal_field_types()
+        line_vals = []
+        for row in rows:
+            vals = {}
+            for field_name, value in row.items():
+                field_type = field_types.get(field_name)
+                if not field_type:
+                    continue
+                try:
+                    if field_type == "many2one":
+                        value = int(value) if value else False
+                    elif field_type == "float":
+                        value = float(value) if value else 0.0
+                    elif field_type == "boolean":
+                        value = bool(value)
+                except (TypeError, ValueError):
+                    raise ValidationError(
+                        _("Invalid value '%s' for field '%s'.") % (value, field_name)
                     )
-                )
-            else:
-                record.move_id = False
+                vals[field_name] = value
+            if vals.get("operation_id"):
+                line_vals.append(vals)
+        return line_vals
 
-    @api.depends("order_id")
-    def _compute_allowed_product_ids(self):
-        for record in self:
-            product_ids = record.order_id.order_line.mapped("product_id.id")
-            record.allowed_product_ids = product_ids
+    def _get_order_indexes(self):
+        """ Index of each sale order of the lines in self, built once per
+        order until its lines or their moves change.
+
+        :return: dict {sale.order record: [sale.order]._get_rma_wizard_index()}
+        """
+        return {order: order.rma_wizard_index for order in self.mapped("order_id")}
 
-    @api.depends("product_id")
-    def _compute_allowed_picking_ids(self):
+    @api.depends("order_id", "product_id", "picking_id", "sale_line_id")
+    def _compute_from_order_index(self):
+        """ The allowed products and pickings and the origin move of all the
+        lines are computed together, so the index of each order is built
+        only once for all of them.
+        """
+        indexes = self._get_order_indexes()
+        move_obj = self.env["stock.move"]
         for record in self:
-            line = record.order_id.order_line.filtered(
-                lambda r: r.product_id == record.product_id
+            index = indexes.get(record.order_id)
+            if not index:
+                record.allowed_product_ids = False
+                record.allowed_picking_ids = False
+                record.move_id = False
+                continue
+            record.allowed_product_ids = index["product_ids"]
+            record.allowed_picking_ids = index["picking_ids"].get(
+                record.product_id.id, []
             )
-            record.allowed_picking_ids = line.mapped("move_ids.picking_id")
+            record.move_id = move_obj.browse(record._get_index_move_ids(index))
+
+    def _get_index_move_ids(self, index):
+        """ Ids of the origin moves of the line, looked up in the index of
+        its order.
+
+        invoked by:
+        sale.order.line.rma.wizard._compute_from_order_index
+        """
+        self.ensure_one()
+        if (
+            not self.picking_id
+            or self.sale_line_id.product_id != self.product_id
+            or self.sale_line_id.order_id != self.order_id
+        ):
+            return []
+        return index["move_ids"].get((self.picking_id.id, self.sale_line_id.id), [])
 
     def _prepare_rma_values(self):
         self.ensure_one()
@@ -17,7 +17,7 @@ class Rma(models.Model):
         help="To how many kits this components corresponds to. Used mainly "
         "for refunding the right quantity",
     )
-    rma_kit_register = fields.Char(readonly=True)
+    rma_kit_register = fields.Char(readonly=True, index=True)
 
     def _get_refund_line_quantity(self):
         """Refund the kit, not the component"""
@@ -26,6 +26,16 @@ class Rma(models.Model):
             return (self.kit_qty, uom)
         return (self.product_uom_qty, self.product_uom)
 
+    def _group_by_kit_register(self):
+        """ Group the RMAs in self by kit register in a single pass.
+
+        :return: dict {rma_kit_register: rma recordset}
+        """
+        groups = {}
+        for rma in self:
+            groups.setdefault(rma.rma_kit_register, []).append(rma.id)
+        return {register: self.browse(ids) for register, ids in groups.items()}
+
     def action_refund(self):
         """We want to process them altogether"""
         phantom_rmas = self.filtered("phantom_bom_product")
@@ -36,23 +46,18 @@ class Rma(models.Model):
             ]
         )
         self -= phantom_rmas
-        for rma_kit_register in phantom_rmas.mapped("rma_kit_register"):
+        kit_groups = phantom_rmas._group_by_kit_register()
+        for rmas_by_register in kit_groups.values():
             # We want to avoid refunding kits that aren't completely processed
-            rmas_by_register = phantom_rmas.filtered(
-                lambda x: x.rma_kit_register == rma_kit_register
-            )
-            if any(rmas_by_register.filtered(lambda x: x.state != "received")):
+            if any(rma.state != "received" for rma in rmas_by_register):
                 raise UserError(
                     _("You can't refund a kit in wich some RMAs aren't received")
                 )
-            self |= rmas_by_register[0]
+        self |= self.browse([rmas[0].id for rmas in kit_groups.values()])
         super().action_refund()
         # We can just link the line to an RMA but we can link several RMAs
         # to one invoice line.
-        for rma_kit_register in set(phantom_rmas.mapped("rma_kit_register")):
-            grouped_rmas = phantom_rmas.filtered(
-                lambda x: x.rma_kit_register == rma_kit_register
-            )
+        for grouped_rmas in kit_groups.values():
             lead_rma = grouped_rmas.filtered("refund_line_id")
             grouped_rmas -= lead_rma
             grouped_rmas.write(
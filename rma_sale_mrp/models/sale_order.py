@@ -1,6 +1,8 @@
 # Copyright 2020 Tecnativa - David Vidal
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
-from odoo import models
+from collections import defaultdict
+
+from odoo import api, fields, models
 
 
 class SaleOrder(models.Model):
@@ -15,62 +17,83 @@ class SaleOrder(models.Model):
         vals["phantom_kit_line"] = data.get("phantom_kit_line", False)
         return vals
 
+    def _get_portal_rma_data_key(self, data):
+        """Tell the kit lines apart from the rows of their kit product"""
+        key = super()._get_portal_rma_data_key(data)
+        return key + (bool(data.get("phantom_kit_line")),)
+
+    def _get_portal_rma_vals_key(self, vals):
+        key = super()._get_portal_rma_vals_key(vals)
+        return key + (bool(vals.get("phantom_kit_line")),)
+
     def get_delivery_rma_data(self):
         """Get the phantom lines we'll be showing in the wizard"""
         data_list = super().get_delivery_rma_data()
-        kit_products = {
-            (x.get("phantom_bom_product"), x.get("sale_line_id"))
-            for x in data_list
-            if x.get("phantom_bom_product")
-        }
-        # For every unique phantom product we'll create a phantom line wich
-        # will be using as the control in frontend and for display purposes
-        # in backend
-        for product, sale_line_id in kit_products:
-            order_line_obj = self.env["sale.order.line"]
-            product_obj = self.env["product.product"]
-            first_component_dict = next(
-                x
-                for x in data_list
-                if x.get("phantom_bom_product", product_obj) == product
-                and x.get("sale_line_id", order_line_obj) == sale_line_id
-            )
-            component_index = data_list.index(first_component_dict)
+        return self._add_rma_kit_lines(data_list)
+
+    def _add_rma_kit_lines(self, data_list):
+        """ For every unique phantom product (per sale line) we'll create a
+        phantom line wich will be using as the control in frontend and for
+        display purposes in backend. It is placed just before the first
+        component of the kit. Everything is indexed in a first pass over
+        data_list, so the cost is linear in the number of rows.
+        """
+        order_line_obj = self.env["sale.order.line"]
+        first_component_index = {}
+        component_quantities = defaultdict(float)
+        for index, data in enumerate(data_list):
+            if data.get("sale_line_id"):
+                component_quantities[
+                    (data.get("product"), data.get("sale_line_id"))
+                ] += data.get("quantity", 0)
+            if data.get("phantom_bom_product"):
+                first_component_index.setdefault(
+                    (data.get("phantom_bom_product"), data.get("sale_line_id")), index
+                )
+        kit_lines = {}
+        for (product, __), index in first_component_index.items():
+            first_component_dict = data_list[index]
             # Prevent miscalculation if there partial deliveries
-            quantity = sum(
-                [
-                    x.get("quantity", 0)
-                    for x in data_list
-                    if x.get("sale_line_id")
-                    and x.get("product") == first_component_dict.get("product")
-                    and x.get("sale_line_id")
-                    == first_component_dict.get("sale_line_id")
-                ]
-            )
-            data_list.insert(
-                component_index,
-                {
-                    "product": product,
-                    "quantity": (
-                        first_component_dict.get("per_kit_quantity")
-                        and (quantity / first_component_dict.get("per_kit_quantity"))
-                    ),
-                    "uom": first_component_dict.get(
-                        "sale_line_id", order_line_obj
-                    ).product_uom,
-                    "phantom_kit_line": True,
-                    "picking": False,
-                    "sale_line_id": first_component_dict.get(
-                        "sale_line_id", order_line_obj
-                    ),
-                },
+            quantity = component_quantities.get(
+                (
+                    first_component_dict.get("product"),
+                    first_component_dict.get("sale_line_id"),
+                ),
+                0,
             )
-        return data_list
+            sale_line = first_component_dict.get("sale_line_id", order_line_obj)
+            kit_lines[index] = {
+                "product": product,
+                "quantity": (
+                    first_component_dict.get("per_kit_quantity")
+                    and (quantity / first_component_dict.get("per_kit_quantity"))
+                ),
+                "uom": sale_line.product_uom,
+                "phantom_kit_line": True,
+                "picking": False,
+                "sale_line_id": sale_line,
+            }
+        result = []
+        for index, data in enumerate(data_list):
+            if index in kit_lines:
+                result.append(kit_lines[index])
+            result.append(data)
+        return result
 
 
 class SaleOrderLine(models.Model):
     _inherit = "sale.order.line"
 
+    # Memo for _rma_is_kit_product: computed for the whole prefetched set of
+    # lines at once and kept in the environment cache
+    rma_is_kit = fields.Boolean(compute="_compute_rma_is_kit")
+
+    @api.depends("product_id", "company_id")
+    def _compute_rma_is_kit(self):
+        kit_products = self._rma_kit_products()
+        for line in self:
+            line.rma_is_kit = (line.product_id.id, line.company_id.id,) in kit_products
+
     def get_delivery_move(self):
         self.ensure_one()
         if self.product_id and not self._rma_is_kit_product():
@@ -87,11 +110,13 @@ class SaleOrderLine(models.Model):
             )
         )
 
-    def prepare_sale_rma_data(self):
+    def prepare_sale_rma_data(self, returnable_quantities=None):
         """We'll take both the sale order product and the phantom one so we
         can play with them when filtering or showing to the customer"""
         self.ensure_one()
-        data = super().prepare_sale_rma_data()
+        data = super().prepare_sale_rma_data(
+            returnable_quantities=returnable_quantities
+        )
         if self.product_id and self._rma_is_kit_product():
             for d in data:
                 d.update(
@@ -123,13 +148,49 @@ class SaleOrderLine(models.Model):
     def _rma_is_kit_product(self):
         """The method _is_phantom_bom isn't available anymore. We wan't to use
         the same rule Odoo does in core"""
-        bom = (
-            self.env["mrp.bom"]
-            .sudo()
-            ._bom_find(
-                product=self.product_id,
-                company_id=self.company_id.id,
-                bom_type="phantom",
-            )
-        )
-        return bom and bom.type == "phantom"
+        return self.rma_is_kit
+
+    def _rma_kit_products(self):
+        """ Apply the rule of [mrp.bom]._bom_find with bom_type='phantom' to
+        all the lines in self with a single BoM query.
+
+        :return: set of (product id, company id) tuples that are kits
+        """
+        lines = self.filtered(lambda x: x.product_id and x.product_id.type != "service")
+        if not lines:
+            return set()
+        products = lines.mapped("product_id")
+        domain = [
+            ("type", "=", "phantom"),
+            "|",
+            ("product_id", "in", products.ids),
+            "&",
+            ("product_id", "=", False),
+            ("product_tmpl_id", "in", products.mapped("product_tmpl_id").ids),
+        ]
+        if all(lines.mapped("company_id")):
+            domain += [
+                "|",
+                ("company_id", "=", False),
+                ("company_id", "in", lines.mapped("company_id").ids),
+            ]
+        boms = self.env["mrp.bom"].sudo().search(domain)
+        bom_companies = {}
+        for bom in boms:
+            if bom.product_id:
+                key = ("product", bom.product_id.id)
+            else:
+                key = ("template", bom.product_tmpl_id.id)
+            bom_companies.setdefault(key, set()).add(bom.company_id.id)
+        kit_products = set()
+        for line in lines:
+            product = line.product_id
+            company_id = line.company_id.id
+            companies = bom_companies.get(
+                ("product", product.id), set()
+            ) | bom_companies.get(("template", product.product_tmpl_id.id), set())
+            if companies and (
+                not company_id or False in companies or company_id in companies
+            ):
+                kit_products.add((product.id, company_id))
+        return kit_products
@@ -145,3 +145,106 @@ class TestRmaSaleMrp(SavepointCase):
         wizard.line_ids.quantity = 1
         with self.assertRaises(ValidationError):
             wizard.create_and_open_rma()
+
+    def test_rma_kit_products(self):
+        order_form = Form(self.env["sale.order"])
+        order_form.partner_id = self.partner
+        for i in range(400):
+            with order_form.order_line.new() as line_form:
+                line_form.product_id = (self.product_kit, self.product_2)[i % 2]
+                line_form.product_uom_qty = 1
+        order = order_form.save()
+        order.invalidate_cache()
+        query_count = self.env.cr.sql_log_count
+        kit_lines = order.order_line.filtered(lambda x: x._rma_is_kit_product())
+        # The BoMs of the whole order are resolved at once
+        self.assertLess(self.env.cr.sql_log_count - query_count, 15)
+        self.assertEqual(len(kit_lines), 200)
+        self.assertEqual(kit_lines.mapped("product_id"), self.product_kit)
+
+    def test_add_rma_kit_lines_large_order(self):
+        # 300 kits of 30 components each, every component delivered in two
+        # moves. Product ids are fake as only the sale line is read.
+        product_obj = self.env["product.product"]
+        data_list = []
+        for kit in range(300):
+            kit_product = product_obj.browse(1000000 + kit)
+            for component in range(30):
+                for __ in range(2):
+                    data_list.append(
+                        {
+                            "product": product_obj.browse(2000000 + component),
+                            "quantity": 3,
+                            "sale_line_id": self.order_line,
+                            "phantom_bom_product": kit_product,
+                            "per_kit_quantity": 2,
+                        }
+                    )
+        result = self.sale_order._add_rma_kit_lines(data_list)
+        kit_lines = [data for data in result if data.get("phantom_kit_line")]
+        self.assertEqual(len(kit_lines), 300)
+        self.assertEqual(len(result), len(data_list) + 300)
+        for index in range(0, len(result), 61):
+            self.assertTrue(result[index].get("phantom_kit_line"))
+            self.assertEqual(
+                result[index]["product"], result[index + 1]["phantom_bom_product"]
+            )
+        # Components are shared by all the kits of the same sale line
+        self.assertEqual(kit_lines[0]["quantity"], 300 * 2 * 3 / 2)
+
+    def test_group_by_kit_register(self):
+        product_kit_2 = self.product_product.create(
+            {"name": "Product test kit 2", "type": "consu"}
+        )
+        self.env["mrp.bom"].create(
+            {
+                "product_id": product_kit_2.id,
+                "product_tmpl_id": product_kit_2.product_tmpl_id.id,
+                "type": "phantom",
+                "bom_line_ids": [
+                    (0, 0, {"product_id": self.product_kit_comp_1.id, "product_qty": 1})
+                ],
+            }
+        )
+        order_form = Form(self.env["sale.order"])
+        order_form.partner_id = self.partner
+        # The same kit spread across two sale lines and another kit
+        lines = [(self.product_kit, 1), (self.product_kit, 2), (product_kit_2, 1)]
+        for product, qty in lines:
+            with order_form.order_line.new() as line_form:
+                line_form.product_id = product
+                line_form.product_uom_qty = qty
+        order = order_form.save()
+        order.action_confirm()
+        picking = order.picking_ids
+        for move in picking.move_lines:
+            move.quantity_done = move.product_uom_qty
+        picking.button_validate()
+        wizard_id = order.action_create_rma()["res_id"]
+        wizard = self.env["sale.order.rma.wizard"].browse(wizard_id)
+        rmas = self.env["rma"].search(wizard.create_and_open_rma()["domain"])
+        other_rma = self.env["rma"].create(
+            {
+                "partner_id": self.partner.id,
+                "product_id": self.product_2.id,
+                "product_uom_qty": 1,
+                "product_uom": self.product_2.uom_id.id,
+                "location_id": order.warehouse_id.rma_loc_id.id,
+            }
+        )
+        groups = (rmas | other_rma)._group_by_kit_register()
+        self.assertEqual(groups.pop(False), other_rma)
+        self.assertEqual(len(groups), 3)
+        self.assertEqual(
+            sorted(len(group) for group in groups.values()), [1, 2, 2],
+        )
+        sale_lines = order.order_line.browse()
+        for register, group in groups.items():
+            self.assertEqual(set(group.mapped("rma_kit_register")), {register})
+            self.assertEqual(len(group.mapped("phantom_bom_product")), 1)
+            self.assertEqual(len(group.mapped("move_id.sale_line_id")), 1)
+            sale_lines |= group.mapped("move_id.sale_line_id")
+        self.assertEqual(sale_lines, order.order_line)
+        self.assertEqual(
+            self.env["rma"].browse().union(*groups.values()), rmas,
+        )
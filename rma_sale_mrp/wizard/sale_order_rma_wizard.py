@@ -93,24 +93,30 @@ class SaleOrderLineRmaWizard(models.TransientModel):
     per_kit_quantity = fields.Float(readonly=True,)
     phantom_kit_line = fields.Boolean(readonly=True)
 
-    @api.depends("picking_id")
-    def _compute_move_id(self):
+    @api.model
+    def _get_portal_fields(self):
+        return super()._get_portal_fields() + [
+            "phantom_bom_product",
+            "per_kit_quantity",
+            "phantom_kit_line",
+        ]
+
+    def _get_index_move_ids(self, index):
         """We need to process kit components separately so we can match them
         against their phantom product"""
-        not_kit = self.filtered(
-            lambda x: not x.phantom_bom_product
-            and not x.sale_line_id._rma_is_kit_product()
-        )
-        super(SaleOrderLineRmaWizard, not_kit)._compute_move_id()
-        for line in self.filtered(lambda x: x.phantom_bom_product and x.picking_id):
-            line.move_id = line.picking_id.move_lines.filtered(
-                lambda ml: (
-                    ml.product_id == line.product_id
-                    and ml.sale_line_id == line.sale_line_id
-                    and ml.sale_line_id.product_id == line.phantom_bom_product
-                    and ml.sale_line_id.order_id == line.order_id
-                )
+        if self.phantom_bom_product:
+            if (
+                not self.picking_id
+                or self.sale_line_id.product_id != self.phantom_bom_product
+                or self.sale_line_id.order_id != self.order_id
+            ):
+                return []
+            return index["product_move_ids"].get(
+                (self.picking_id.id, self.sale_line_id.id, self.product_id.id), []
             )
+        if self.sale_line_id._rma_is_kit_product():
+            return []
+        return super()._get_index_move_ids(index)
 
     def _prepare_rma_values(self):
         """It will be used as a reference for the components"""